@@ -8,7 +8,7 @@ setup(
     author='Mark McArdle',
     author_email='m.mc4rdle@gmail.com',
     packages=['sizefs', 'sizefs.test'],
-    scripts=[],
+    scripts=['bin/sizefs'],
     #url='http://pypi.python.org/pypi/SizeFS/',
     license='LICENSE.txt',
     description='SizeFS is a tool for creating files of particular sizes.',
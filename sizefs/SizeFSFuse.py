@@ -3,27 +3,51 @@
 import logging
 
 from collections import defaultdict
-from errno import ENOENT, EPERM
+from errno import EINVAL, ENOENT, ENXIO, EPERM
 from stat import S_IFDIR, S_IFLNK, S_IFREG
 from sys import argv, exit
 from time import time
 
-import re
+import hashlib
 import os
 import stat
-from contents import Filler
+from contents import Filler, PatternError, make_filler
+from sizefs import SinkFile, SizeFile, SEEK_DATA, SEEK_HOLE
+from sizes import is_size, parse_size, UNITS
+from readahead import ReadAhead, BLOCK_SIZE
+from throttle import PerfProfile
+from tree import DIR, FILE, get_tree
 
-from fuse import FUSE, FuseOSError, Operations, LoggingMixIn
+from fuse import FUSE, FuseOSError, Operations, LoggingMixIn, c_stat, set_st_attrs
 
 if not hasattr(__builtins__, 'bytes'):
     bytes = str
 
-FILE_REGEX = re.compile("^(?P<size>[0-9]+(\.[0-9])?)(?P<size_si>[TGMKB])"
-                        "((?P<operator>[\+|\-])(?P<shift>\d+)(?P<shift_si>[TGMKB]))?$")
+ENOATTR = 1009  # Python 2 does not provide ENOATTR in errno for some reason
 
-ONE_K = 1024
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_TRUNC
+
+TREE_FOLDER = '/tree'
+
+
+class SizeFUSE(FUSE):
+    """
+     FUSE ignores the offset the kernel gives readdir, so a filesystem has to list a whole directory every time it
+     is asked for the next page. This passes the offset on to the filesystem's readdir, which yields (name, attrs,
+     offset) items starting after that offset.
+    """
+
+    def readdir(self, path, buf, filler, offset, fip):
+        for (name, attrs, next_offset) in self.operations('readdir', self._decode_optional_path(path),
+                                                          fip.contents.fh, offset):
+            st = None
+            if attrs:
+                st = c_stat()
+                set_st_attrs(st, attrs, use_ns=self.use_ns)
+            if filler(buf, name.encode(self.encoding), st, next_offset) != 0:
+                break
+        return 0
 
-ENOATTR = 1009  # Python 2 does not provide ENOATTR in errno for some reason
 
 class SizeFSFuse(LoggingMixIn, Operations):
     """
@@ -33,12 +57,49 @@ class SizeFSFuse(LoggingMixIn, Operations):
      Each directory contains a list of commonly useful file sizes, however non-listed files of arbitrary size
      can be opened and read from. The size spec comes from the filename, e.g.
 
-       open("/<folder>/1.1T-1")
+       open("/<folder>/1.5T-1")
+
+     Files in folders whose pattern is NUL bytes, such as /sparse, are reported as holes through st_blocks. lseek
+     answers SEEK_DATA/SEEK_HOLE too, but it is only called through bindings for libfuse 3.8 or later, fusepy 3.0
+     uses the libfuse 2 operations table, which has no lseek.
+
+     Setting the "generator" xattr of a folder to a generator spec such as "compressible:ratio=0.5" or
+     "incompressible:seed=7" fills its files from that generator instead of the pattern (see contents.py).
+     Setting the "seed" xattr of a folder makes the random choices of its pattern the same on every read.
+
+     Folders with a "sink" xattr, such as /sink, accept writes and discard them. The value names the hashlib
+     checksum (or "none") of the written data, which files expose with their count in the "checksum" and
+     "bytes_written" xattrs.
+
+     The "bandwidth" (e.g. "10MB/s"), "read_latency", "getattr_latency" and "open_latency" (e.g. "5ms" or
+     "exponential(2ms)") xattrs of a folder make it behave like slow storage (see throttle.py). Waits only hold up
+     the thread of the request, so with the default multithreaded FUSE loop other readers carry on.
+
+     Any path /tree/<spec> is a synthetic tree, e.g. /tree/depth=4,fanout=1000,sizes=lognormal(64KB,1.5), with
+     entries computed from the spec and their path when they are looked up (see tree.py). Mount with SizeFUSE so
+     that readdir is given the kernel's offsets and lists huge directories a page at a time.
+
+     With readahead set to a number of bytes, such as readahead.MAX_WINDOW, files read sequentially are generated
+     up to that far ahead of the reader in a background thread per open file (see readahead.py). It is off by
+     default, as generating content holds the interpreter lock and it has not been measured to help. The hits and
+     misses of all files are the "readahead_hits" and "readahead_misses" xattrs of /.
+
+     The "files" xattr of a folder is a comma separated list of file names, such as "1KB,1MB,1GB", that readdir
+     lists. Other names can still be opened.
+
+     The "units" xattr of a folder selects whether SI prefixes in its filenames are "binary" (the default) or
+     "decimal", IEC prefixes such as 1PiB-4KiB are always binary (see sizes.py)
     """
 
-    def __init__(self):
+    def __init__(self, readahead=0):
         self.folders = {}
         self.files = {}
+        self.handles = {}
+        self.readahead = readahead
+        self.readahead_totals = dict(hits=0, misses=0, prefetched=0)
+        self.sinks = {}
+        self.fillers = {}
+        self.profiles = {}
         self.data = defaultdict(bytes)
         self.fd = 0
         now = time()
@@ -50,6 +111,12 @@ class SizeFSFuse(LoggingMixIn, Operations):
         self.setxattr('/zeros', "pattern", "0", None)
         self.mkdir('/ones', (S_IFDIR | 0444))
         self.setxattr('/ones', "pattern", "1", None)
+        self.mkdir('/sparse', (S_IFDIR | 0444))
+        self.setxattr('/sparse', "pattern", "\0", None)
+        self.mkdir(TREE_FOLDER, (S_IFDIR | 0444))
+        self.mkdir('/sink', (S_IFDIR | 0777))
+        self.setxattr('/sink', "sink", "md5", None)
+        self.folders['/sink']['st_mode'] = S_IFDIR | 0777
         self.mkdir('/alpha_num', (S_IFDIR | 0444))
         self.setxattr('/alpha_num', "pattern", "[a-z,A-Z,0-9]", None)
 
@@ -66,41 +133,50 @@ class SizeFSFuse(LoggingMixIn, Operations):
         """
         return FuseOSError(EPERM)
 
-    def create(self, path, mode):
+    def create(self, path, mode, fi=None):
         """
-         We'll return EPERM error to indicate that the user cannot create files
+         Files can only be created in sink folders, anywhere else we raise EPERM
         """
-        return FuseOSError(EPERM)
+        sink_file = self._create_sink(path)
+        self.fd += 1
+        self.handles[self.fd] = sink_file
+        return self.fd
 
     def getattr(self, path, fh=None):
         """
          Getattr either returns an attribute dict for a folder from the self.folders map, or it returns a standard
          attribute dict for any valid files
         """
-        (folder, filename) = os.path.split(path)
+        if path in self.folders:
+            return self.folders[path]
 
-        # Does the folder exist?
-        if not folder in self.folders:
-            return FuseOSError(ENOENT)
+        profile = self._profile(os.path.dirname(path))
+        if profile is not None:
+            profile.before_getattr()
 
-        # Does the requested filename match our size spec?
-        if not FILE_REGEX.match(filename):
-            return FuseOSError(ENOENT)
+        if self._tree_lookup(path) is not None:
+            return self._tree_attrs(None)
 
-        if path in self.folders:
-            return self.folders[path]
-        else:
-            return dict(st_mode=(S_IFREG | 0444), st_nlink=1,
-                        st_size=0, st_ctime=time(), st_mtime=time(),
-                        st_atime=time())
+        if path in self.sinks:
+            now = time()
+            return dict(st_mode=(S_IFREG | 0666), st_nlink=1,
+                        st_size=self.sinks[path].length, st_blocks=0,
+                        st_ctime=now, st_mtime=now, st_atime=now)
+
+        size_file = self._size_file(path)
+        now = time()
+        return dict(st_mode=(S_IFREG | 0444), st_nlink=1,
+                    st_size=size_file.length,
+                    st_blocks=size_file.blocks(),
+                    st_ctime=now, st_mtime=now, st_atime=now)
 
     def getxattr(self, path, name, position=0):
         """
          Returns an extended attribute of a file/folder
-         This is always an ENOATTR error for files, and the only thing that should ever really be used
-         for folders is the pattern
+         This is always an ENOATTR error for files other than those in sink folders, which have bytes_written
+         and checksum, and the only thing that should ever really be used for folders is the pattern
         """
-        attrs = self.folders[path].get('attrs', {})
+        attrs = self._xattrs(path)
 
         if name in attrs:
             return attrs[name]
@@ -111,8 +187,7 @@ class SizeFSFuse(LoggingMixIn, Operations):
         """
          Return a list of all extended attribute names for a folder (always empty for files)
         """
-        attrs = self.folders[path].get('attrs', {})
-        return attrs.keys()
+        return self._xattrs(path).keys()
 
     def mkdir(self, path, mode):
         """
@@ -128,31 +203,109 @@ class SizeFSFuse(LoggingMixIn, Operations):
 
     def open(self, path, flags):
         """
-         We check that a file conforms to a size spec and is from a requested folder
+         We check that a file conforms to a size spec and is from a requested folder, or is in a sink folder
         """
         (folder, filename) = os.path.split(path)
-
-        # Does the folder exist?
-        if not folder in self.folders:
-            return FuseOSError(ENOENT)
-
-        # Does the requested filename match our size spec?
-        if not FILE_REGEX.match(filename):
-            return FuseOSError(ENOENT)
-
-        ## Now do the right thing and open one of the file objects (add it to files)
-
+        profile = self._profile(folder)
+        if profile is not None:
+            profile.before_open()
+        if path in self.sinks or (flags & WRITE_FLAGS and self._is_sink(folder)):
+            if path not in self.sinks:
+                self._create_sink(path)
+            handle = self.sinks[path]
+            if flags & os.O_TRUNC:
+                handle.truncate(0)
+        else:
+            handle = self._size_file(path)
+            # Throttled folders are left alone, as storage that is slow would be, fixed patterns are cheaper
+            # to tile than to buffer and files of a couple of blocks are read before prefetching could help
+            if self.readahead and handle.profile is None and not handle.filler.fixed and \
+                    handle.length > 2 * BLOCK_SIZE:
+                handle = ReadAhead(handle, max_window=self.readahead)
         self.fd += 1
+        self.handles[self.fd] = handle
         return self.fd
 
     def read(self, path, size, offset, fh):
         """
          Returns content based on the pattern of the containing folder
         """
-        return self.data[path][offset:offset + size]
-
-    def readdir(self, path, fh):
-        return ['.', '..'] + [x[1:] for x in self.files if x != '/']
+        size_file = self.handles.get(fh)
+        if size_file is None:
+            size_file = self._size_file(path)
+        return size_file.pread(size, offset)
+
+    def release(self, path, fh):
+        handle = self.handles.pop(fh, None)
+        if isinstance(handle, ReadAhead):
+            handle.close()
+            stats = handle.stats()
+            for name in self.readahead_totals:
+                self.readahead_totals[name] += stats[name]
+        return 0
+
+    def readahead_stats(self):
+        """
+         Returns the readahead hits, misses and prefetched blocks of all handles, open and released
+        """
+        totals = dict(self.readahead_totals)
+        for handle in self.handles.values():
+            if isinstance(handle, ReadAhead):
+                stats = handle.stats()
+                for name in totals:
+                    totals[name] += stats[name]
+        return totals
+
+    def lseek(self, path, offset, whence, fh):
+        """
+         Supports SEEK_DATA and SEEK_HOLE so that holes in sparse files can be skipped, this is only called by
+         bindings for libfuse 3.8 or later, not by fusepy 3.0, and otherwise tools fall back to reading the holes
+        """
+        size_file = self.handles.get(fh)
+        if size_file is None:
+            size_file = self._size_file(path)
+        if isinstance(size_file, ReadAhead):
+            size_file = size_file.size_file
+        try:
+            if whence == SEEK_DATA:
+                return size_file.seek_data(offset)
+            elif whence == SEEK_HOLE:
+                return size_file.seek_hole(offset)
+        except IOError:
+            raise FuseOSError(ENXIO)
+        raise FuseOSError(EINVAL)
+
+    def readdir(self, path, fh, offset=0):
+        """
+         Yields (name, attrs, offset) for the entries of a folder, starting after the entry at 'offset'. The
+         entries of synthetic trees are computed as they are listed, so SizeFUSE passes the kernel's offset here
+         and huge directories are listed a page at a time. The attrs are full getattr results, so that where the
+         kernel and FUSE use readdirplus they need not getattr every entry
+        """
+        entries = [('.', self.getattr(path)), ('..', None)]
+        tree_dir = self._tree_lookup(path)
+        if tree_dir is not None:
+            (tree, components) = tree_dir
+            names = tree.entries(components, max(0, offset - len(entries)))
+            listing = ((name, self._tree_attrs(size)) for (name, size) in names)
+        else:
+            if path not in self.folders:
+                raise FuseOSError(ENOENT)
+            children = [(os.path.basename(child), self.folders[child])
+                        for child in sorted(self.folders) if child != '/' and os.path.dirname(child) == path]
+            children += [(os.path.basename(child), self.getattr(child))
+                         for child in sorted(self.sinks) if os.path.dirname(child) == path]
+            listed = self.folders[path].get('attrs', {}).get('files', '')
+            children += [(filename, self.getattr(os.path.join(path, filename)))
+                         for filename in listed.split(",") if filename]
+            listing = iter(children[max(0, offset - len(entries)):])
+
+        for (index, (name, attrs)) in enumerate(entries[offset:], offset):
+            yield name, attrs, index + 1
+        index = max(offset, len(entries))
+        for (name, attrs) in listing:
+            index += 1
+            yield name, attrs, index
 
     def readlink(self, path):
         return self.data[path]
@@ -162,6 +315,8 @@ class SizeFSFuse(LoggingMixIn, Operations):
 
         if name in attrs:
             del attrs[name]
+            self.fillers.pop(path, None)
+            self.profiles.pop(path, None)
         else:
             return FuseOSError(ENOATTR)
 
@@ -177,12 +332,170 @@ class SizeFSFuse(LoggingMixIn, Operations):
 
     def setxattr(self, path, name, value, options, position=0):
         # Ignore options
+        if name == "units" and value not in UNITS:
+            raise FuseOSError(EINVAL)
+        if name in PerfProfile.SETTINGS:
+            try:
+                PerfProfile(**{name: value})
+            except ValueError:
+                raise FuseOSError(EINVAL)
+        if name == "sink" and value != "none":
+            try:
+                hashlib.new(value)
+            except ValueError:
+                raise FuseOSError(EINVAL)
+        if name == "generator":
+            try:
+                make_filler(value)
+            except PatternError:
+                raise FuseOSError(EINVAL)
+        if name == "seed":
+            try:
+                int(value)
+            except ValueError:
+                raise FuseOSError(EINVAL)
+        if name == "files" and not all(is_size(filename) for filename in value.split(",") if filename):
+            raise FuseOSError(EINVAL)
         if path in self.folders:
             attrs = self.folders[path].setdefault('attrs', {})
             attrs[name] = value
+            self.fillers.pop(path, None)
+            self.profiles.pop(path, None)
         else:
             return FuseOSError(EPERM)
 
+    def _units(self, folder):
+        """
+         Returns the unit convention used for the size specs of files in a folder
+        """
+        return self.folders[folder].get('attrs', {}).get('units', 'binary')
+
+    def _filler(self, folder):
+        """
+         Returns the Filler for the generator or pattern xattr of a folder
+        """
+        filler = self.fillers.get(folder)
+        if filler is None:
+            attrs = self.folders[folder].get('attrs', {})
+            if 'generator' in attrs:
+                filler = make_filler(attrs['generator'])
+            else:
+                seed = attrs.get('seed')
+                filler = Filler(regenerate=True, pattern=attrs.get('pattern', "0"),
+                                seed=None if seed is None else int(seed))
+            self.fillers[folder] = filler
+        return filler
+
+    def _tree_lookup(self, path, kind=DIR):
+        """
+         Returns (tree, components) for a directory in a synthetic tree, or the size of a file in one when kind is
+         FILE, or None if there is no such entry
+        """
+        if not path.startswith(TREE_FOLDER + '/'):
+            return None
+        parts = path[len(TREE_FOLDER) + 1:].split('/')
+        tree = get_tree(parts[0])
+        if tree is None:
+            return None
+        components = tuple(parts[1:])
+        found = tree.lookup(components)
+        if found is None or found[0] != kind:
+            return None
+        if kind == FILE:
+            return found[1]
+        return tree, components
+
+    def _tree_attrs(self, size):
+        """
+         Returns the attributes of a directory (size None) or a file in a synthetic tree
+        """
+        now = time()
+        if size is None:
+            return dict(st_mode=(S_IFDIR | 0444), st_nlink=2, st_size=0,
+                        st_ctime=now, st_mtime=now, st_atime=now)
+        return dict(st_mode=(S_IFREG | 0444), st_nlink=1, st_size=size,
+                    st_blocks=(self._filler(TREE_FOLDER).allocated(size) + 511) // 512,
+                    st_ctime=now, st_mtime=now, st_atime=now)
+
+    def _profile(self, folder):
+        """
+         Returns the PerfProfile for the bandwidth and latency xattrs of a folder, or None if it has none
+        """
+        if folder.startswith(TREE_FOLDER + '/'):
+            folder = TREE_FOLDER
+        if folder in self.profiles:
+            return self.profiles[folder]
+        if folder not in self.folders and folder != TREE_FOLDER:
+            # Not cached, so that lookups of missing folders cannot grow the cache
+            return None
+        attrs = self.folders.get(folder, {}).get('attrs', {})
+        settings = dict((name, attrs[name]) for name in PerfProfile.SETTINGS if name in attrs)
+        profile = PerfProfile(**settings) if settings else None
+        self.profiles[folder] = profile
+        return profile
+
+    def _is_sink(self, folder):
+        """
+         Returns True if folder has a sink xattr naming its checksum (or "none")
+        """
+        return folder in self.folders and 'sink' in self.folders[folder].get('attrs', {})
+
+    def _create_sink(self, path):
+        """
+         Starts counting the writes to a new file in a sink folder, raises EPERM for any other folder
+        """
+        (folder, filename) = os.path.split(path)
+        if not self._is_sink(folder):
+            raise FuseOSError(EPERM)
+        checksum = self.folders[folder]['attrs']['sink']
+        sink_file = SinkFile(path, checksum=None if checksum == "none" else checksum)
+        self.sinks[path] = sink_file
+        return sink_file
+
+    def _xattrs(self, path):
+        """
+         Returns the extended attributes of a folder or of a file in a sink folder
+        """
+        if path in self.sinks:
+            sink_file = self.sinks[path]
+            attrs = dict(bytes_written=str(sink_file.bytes_written))
+            if sink_file.checksum() is not None:
+                attrs['checksum'] = sink_file.checksum()
+            return attrs
+        if path == '/':
+            attrs = dict(self.folders[path].get('attrs', {}))
+            for (name, value) in self.readahead_stats().items():
+                attrs['readahead_' + name] = str(value)
+            return attrs
+        if path in self.folders:
+            return self.folders[path].get('attrs', {})
+        return {}
+
+    def _size_file(self, path):
+        """
+         Returns a SizeFile for a path, raises ENOENT unless the path is in a folder and its name is a size spec
+        """
+        (folder, filename) = os.path.split(path)
+
+        # Is it a file in a synthetic tree?
+        if folder.startswith(TREE_FOLDER + '/'):
+            tree_file = self._tree_lookup(path, FILE)
+            if tree_file is None:
+                raise FuseOSError(ENOENT)
+            return SizeFile(path, tree_file, filler=self._filler(TREE_FOLDER), profile=self._profile(TREE_FOLDER))
+
+        # Does the folder exist?
+        if not folder in self.folders:
+            raise FuseOSError(ENOENT)
+
+        # Does the requested filename match our size spec?
+        try:
+            size = parse_size(filename, self._units(folder))
+        except ValueError:
+            raise FuseOSError(ENOENT)
+
+        return SizeFile(path, size, filler=self._filler(folder), profile=self._profile(folder))
+
     def statfs(self, path):
         return dict(f_bsize=512, f_blocks=4096, f_bavail=2048)
 
@@ -190,11 +503,16 @@ class SizeFSFuse(LoggingMixIn, Operations):
         return FuseOSError(EPERM)
 
     def truncate(self, path, length, fh=None):
-        return FuseOSError(EPERM)
+        if path in self.sinks:
+            self.sinks[path].truncate(length)
+        else:
+            raise FuseOSError(EPERM)
 
     def unlink(self, path):
         if path in self.folders:
             self.folders.pop(path)
+        elif path in self.sinks:
+            self.sinks.pop(path)
         else:
             return FuseOSError(EPERM)
 
@@ -202,7 +520,13 @@ class SizeFSFuse(LoggingMixIn, Operations):
         pass
 
     def write(self, path, data, offset, fh):
-        return FuseOSError(EPERM)
+        """
+         Writes to files in sink folders are counted and checksummed, then discarded
+        """
+        handle = self.handles.get(fh)
+        if not isinstance(handle, SinkFile):
+            raise FuseOSError(EPERM)
+        return handle.pwrite(data, offset)
 
 
 if __name__ == '__main__':
@@ -211,4 +535,4 @@ if __name__ == '__main__':
         exit(1)
 
     logging.getLogger().setLevel(logging.DEBUG)
-    fuse = FUSE(SizeFSFuse(), argv[1], foreground=True)
\ No newline at end of file
+    fuse = SizeFUSE(SizeFSFuse(), argv[1], foreground=True)
\ No newline at end of file
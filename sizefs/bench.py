@@ -0,0 +1,159 @@
+"""
+Benchmarks
+==========
+
+Measures how fast SizeFS generates content. bench_workers reads a file
+through a ShardedServer with each of a list of worker counts and returns
+the aggregate throughput of each, in bytes per second
+
+    python bench.py --size 1GB --workers 0,1,2,4,8 workers incompressible
+
+where the argument is a generator spec (see contents.make_filler) or, with
+--pattern, a pattern. A worker count of 0 reads in the front end alone.
+
+bench_patterns compares the generator each kind of pattern is filled by
+with the general pattern interpreter
+
+    python bench.py --size 1GB patterns 0 abc "[a-z]{3}-"
+
+The interpreter, and variable patterns, are timed on at most
+--baseline-size bytes, as they are too slow to read 1GB in reasonable time.
+"""
+
+__author__ = 'mm'
+
+import threading
+import time
+from optparse import OptionParser
+
+from contents import Filler, make_filler, VARIABLE
+from serve import ShardedServer, BLOCK_SIZE
+from sizefs import SizeFS
+from sizes import parse_size
+
+READ_SIZE = 16 * 1024 * 1024
+BASELINE_SIZE = 1024 * 1024
+# A pattern of each kind
+PATTERNS = ("0", "abc", "[a-z,A-Z,0-9]", "[a-z]{3}-[0-9]{2}",
+            "a(bcd)*e{4}[a-z,0,3]*")
+
+
+def bench_workers(sfs, path, workers=(0, 1, 2, 4), size=None,
+                  read_size=READ_SIZE, readers=1, block_size=BLOCK_SIZE):
+    """
+    Returns [(workers, bytes per second)] for reading 'size' bytes of a file
+    (all of it by default) in reads of 'read_size' bytes, with 'readers'
+    threads each reading their own part
+    """
+    results = []
+    for count in workers:
+        with ShardedServer(sfs, count, block_size) as server:
+            length = server.size(path)
+            if size is not None:
+                length = min(size, length)
+            part = length // readers
+
+            def _read(start, stop):
+                """ reads part of the file """
+                for offset in xrange(start, stop, read_size):
+                    server.read(path, min(read_size, stop - offset), offset)
+
+            threads = [threading.Thread(target=_read,
+                                        args=(i * part, (i + 1) * part))
+                       for i in xrange(readers)]
+            started = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - started
+            results.append((count, part * readers / elapsed))
+    return results
+
+
+def _rate(read, size, read_size):
+    """ returns the bytes per second of read(size, offset) over 'size' """
+    started = time.time()
+    for offset in xrange(0, size, read_size):
+        read(min(read_size, size - offset), offset)
+    return size / max(time.time() - started, 1e-9)
+
+
+def bench_patterns(patterns=PATTERNS, size=1 << 30, read_size=READ_SIZE,
+                   baseline_size=BASELINE_SIZE, seed=0):
+    """
+    Returns [(pattern, kind, bytes per second, interpreter bytes per
+    second)] for reading 'size' bytes of content of each pattern
+    """
+    results = []
+    for pattern in patterns:
+        filler = Filler(regenerate=True, pattern=pattern, seed=seed)
+        # Variable patterns are interpreted either way
+        fill_size = size
+        if filler.kind == VARIABLE:
+            fill_size = min(size, baseline_size)
+        rate = _rate(filler.fill, fill_size, read_size)
+        baseline = _rate(lambda length, _: filler.interpret(length),
+                         min(size, baseline_size), read_size)
+        results.append((pattern, filler.kind, rate, baseline))
+    return results
+
+
+def _filler(spec, pattern=False, seed=None):
+    """ returns the filler for a generator spec or a pattern """
+    if pattern:
+        return Filler(regenerate=True, pattern=spec, seed=seed)
+    return make_filler(spec)
+
+
+def main():
+    """ runs the benchmarks given on the command line """
+    parser = OptionParser(usage="%prog [options] workers [generator-or-pattern]"
+                          "\n       %prog [options] patterns [pattern ...]")
+    parser.add_option("--size", default="1GB", help="bytes read per run")
+    parser.add_option("--read-size", default="16MB", help="bytes per read")
+    parser.add_option("--block-size", default="1MB",
+                      help="size of the blocks of a shard")
+    parser.add_option("--workers", default="0,1,2,4",
+                      help="comma separated worker counts")
+    parser.add_option("--readers", type="int", default=1,
+                      help="threads reading at once")
+    parser.add_option("--pattern", action="store_true", default=False,
+                      help="the argument is a pattern, not a generator")
+    parser.add_option("--seed", type="int", default=0,
+                      help="seed of a pattern")
+    parser.add_option("--baseline-size", default="1MB",
+                      help="bytes read by the pattern interpreter")
+    options, args = parser.parse_args()
+    if not args or args[0] not in ('workers', 'patterns'):
+        parser.error("choose the workers or patterns benchmark")
+    size = parse_size(options.size)
+    read_size = parse_size(options.read_size)
+
+    if args[0] == 'patterns':
+        print "%-24s %-14s %12s %12s %9s" % ("pattern", "kind", "MB/s",
+                                              "interp MB/s", "speedup")
+        for pattern, kind, rate, baseline in bench_patterns(
+                args[1:] or PATTERNS, size, read_size,
+                parse_size(options.baseline_size), options.seed):
+            print "%-24s %-14s %12.1f %12.1f %8.0fx" % (
+                pattern, kind, rate / 1048576, baseline / 1048576,
+                rate / baseline)
+        return
+
+    spec = args[1] if len(args) > 1 else 'incompressible'
+
+    sfs = SizeFS()
+    sfs.add_generator_dir('bench', _filler(spec, options.pattern,
+                                           options.seed))
+    path = 'bench/%d' % size
+    workers = [int(count) for count in options.workers.split(",")]
+    print "%8s %12s" % ("workers", "MB/s")
+    for count, rate in bench_workers(sfs, path, workers, size,
+                                     read_size, options.readers,
+                                     parse_size(options.block_size)):
+        print "%8d %12.1f" % (count, rate / 1048576)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+"""
+Command line
+============
+
+The sizefs command mounts, serves, benchmarks or verifies a SizeFS described
+by a config file, so that a run can be repeated exactly from the file
+
+    sizefs --config sizefs.json mount /mnt/sizefs
+    sizefs --config sizefs.json serve
+    sizefs --config sizefs.json bench
+    sizefs --config sizefs.json verify noise/1GB copied_1GB
+
+Config files are JSON, or YAML or TOML when PyYAML or toml is installed,
+chosen by the file's extension. Sizes may be numbers of bytes or size specs
+and every section is optional
+
+    {
+      "directories": {
+        "noise": {"generator": "incompressible:seed=7",
+                  "files": ["1MB", "1GB"]},
+        "words": {"pattern": "[a-z]{3} ", "seed": 1, "units": "decimal",
+                  "profile": {"bandwidth": "100MB/s", "read_latency": "2ms"}},
+        "uploads": {"sink": "sha1"}
+      },
+      "cache": {"paths": 65536, "sizes": 65536, "trees": 1024},
+      "fuse": {"mountpoint": "/mnt/sizefs", "threads": true,
+               "readahead": "8MB", "foreground": true, "debug": false},
+      "serve": {"host": "127.0.0.1", "port": 8000, "workers": 4,
+                "block_size": "1MB"},
+      "metrics": "127.0.0.1:9100",
+      "bench": {"paths": ["noise/1GB"], "size": "1GB", "read_size": "16MB",
+                "workers": [0, 1, 2, 4], "readers": 1,
+                "patterns": ["0", "[a-z]{3}-"], "seed": 0}
+    }
+
+A directory has a "pattern" (with "seed", "max_random" and "regenerate"), a
+"generator" or a "sink" checksum ("none" to only count), and optionally
+"units", "files" to list and a "profile" of throttle.PerfProfile settings.
+With "metrics" set, mount and serve answer GET / on that address with their
+counters as JSON. Metrics need a foreground mount: libfuse daemonizes a
+background mount by forking, and the metrics thread would not survive the
+fork.
+"""
+
+__author__ = 'mm'
+
+import BaseHTTPServer
+import json
+import logging
+import os
+import sys
+import threading
+from optparse import OptionParser
+from stat import S_IFDIR
+
+import sizes
+import tree
+from bench import bench_patterns, bench_workers, READ_SIZE, PATTERNS
+from contents import make_filler
+from serve import BLOCK_SIZE, ShardedServer, SizeFSHTTPServer
+from sizefs import SizeFS, PATH_CACHE_SIZE
+from throttle import PerfProfile
+from verify import verify
+
+SECTIONS = ('directories', 'cache', 'fuse', 'serve', 'metrics', 'bench')
+DIRECTORY_KEYS = ('pattern', 'seed', 'max_random', 'regenerate',
+                  'generator', 'sink', 'units', 'files', 'profile')
+COMMANDS = ('mount', 'serve', 'bench', 'verify')
+
+
+def load_config(path):
+    """
+    Returns the config in a JSON, YAML (.yaml, .yml) or TOML (.toml) file,
+    raises a ValueError if it is not a valid config
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path) as config_file:
+        text = config_file.read()
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("reading %s needs PyYAML" % path)
+        config = yaml.safe_load(text)
+    elif extension == '.toml':
+        try:
+            import toml
+        except ImportError:
+            raise ValueError("reading %s needs toml" % path)
+        config = toml.loads(text)
+    else:
+        config = json.loads(text)
+    config = _native(config or {})
+    check_config(config)
+    return config
+
+
+def _native(value):
+    """
+    Returns a parsed config with its text as byte strings, patterns are
+    bytes so each character must be below 256
+    """
+    if isinstance(value, unicode):
+        try:
+            return value.encode('latin-1')
+        except UnicodeError:
+            raise ValueError("%r has characters that are not bytes" % value)
+    elif isinstance(value, dict):
+        return dict((_native(key), _native(item))
+                    for key, item in value.items())
+    elif isinstance(value, list):
+        return [_native(item) for item in value]
+    return value
+
+
+def check_config(config):
+    """ raises a ValueError if a config has unknown sections or keys """
+    if not isinstance(config, dict):
+        raise ValueError("a config must be a mapping")
+    for section in config:
+        if section not in SECTIONS:
+            raise ValueError("unknown config section %s" % section)
+    for name, directory in config.get('directories', {}).items():
+        for key in directory:
+            if key not in DIRECTORY_KEYS:
+                raise ValueError("unknown key %s in directory %s" %
+                                 (key, name))
+        kinds = [key for key in ('pattern', 'generator', 'sink')
+                 if key in directory]
+        if len(kinds) > 1:
+            raise ValueError("directory %s has both %s" %
+                             (name, " and ".join(kinds)))
+        for setting in directory.get('profile', {}):
+            if setting not in PerfProfile.SETTINGS:
+                raise ValueError("unknown profile setting %s" % setting)
+
+
+def _size(value):
+    """ returns a number of bytes given as a number or a size spec """
+    if isinstance(value, basestring):
+        return sizes.parse_size(value)
+    return int(value)
+
+
+def _checksum(directory):
+    """ returns the checksum of a sink directory, None for "none" """
+    checksum = directory['sink']
+    if checksum in (None, 'none'):
+        return None
+    return checksum
+
+
+def apply_cache(config):
+    """ sets the sizes of the size and tree caches """
+    cache = config.get('cache', {})
+    if 'sizes' in cache:
+        sizes.CACHE_SIZE = int(cache['sizes'])
+    if 'trees' in cache:
+        tree.CACHE_SIZE = int(cache['trees'])
+
+
+def build_sizefs(config):
+    """ returns a SizeFS with the directories of a config """
+    apply_cache(config)
+    cache = config.get('cache', {})
+    sfs = SizeFS(path_cache_size=int(cache.get('paths', PATH_CACHE_SIZE)))
+    for name, directory in sorted(config.get('directories', {}).items()):
+        units = directory.get('units', 'binary')
+        if 'generator' in directory:
+            sfs.add_generator_dir(name, make_filler(directory['generator']),
+                                  units)
+        elif 'sink' in directory:
+            sfs.add_sink_dir(name, _checksum(directory))
+        else:
+            sfs.add_regex_dir(name, directory.get('pattern', "0"),
+                              directory.get('max_random', 128),
+                              directory.get('regenerate', True), units,
+                              directory.get('seed'))
+        if 'files' in directory:
+            sfs.set_listing(name, directory['files'])
+        if 'profile' in directory:
+            sfs.set_profile(name, **directory['profile'])
+    return sfs
+
+
+def build_fuse(config):
+    """ returns a SizeFSFuse with the folders of a config """
+    from SizeFSFuse import SizeFSFuse
+    apply_cache(config)
+    fuse_config = config.get('fuse', {})
+    operations = SizeFSFuse(readahead=_size(fuse_config.get('readahead', 0)))
+    for name, directory in sorted(config.get('directories', {}).items()):
+        folder = '/' + name
+        if folder not in operations.folders:
+            operations.mkdir(folder, S_IFDIR | 0444)
+        attrs = {}
+        if 'generator' in directory:
+            attrs['generator'] = directory['generator']
+        elif 'sink' in directory:
+            attrs['sink'] = directory['sink'] or 'none'
+            operations.folders[folder]['st_mode'] = S_IFDIR | 0777
+        else:
+            attrs['pattern'] = directory.get('pattern', "0")
+            if directory.get('seed') is not None:
+                attrs['seed'] = str(directory['seed'])
+        if 'units' in directory:
+            attrs['units'] = directory['units']
+        if 'files' in directory:
+            attrs['files'] = ",".join(directory['files'])
+        attrs.update(directory.get('profile', {}))
+        for (attr, value) in sorted(attrs.items()):
+            operations.setxattr(folder, attr, value, None)
+    return operations
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ answers GET with the server's metrics as JSON """
+
+    def do_GET(self):  # pylint: disable=C0103
+        body = json.dumps(self.server.collect(), sort_keys=True)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=W0221
+        pass
+
+
+def start_metrics(address, collect):
+    """
+    Serves the dict returned by collect() as JSON on 'address' (host:port)
+    from a background thread, returns the server
+    """
+    host, _, port = address.rpartition(':')
+    server = BaseHTTPServer.HTTPServer((host or '127.0.0.1', int(port)),
+                                       MetricsHandler)
+    server.collect = collect
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def mount(config, mountpoint=None):
+    """ mounts the SizeFSFuse of a config """
+    fuse_config = config.get('fuse', {})
+    mountpoint = mountpoint or fuse_config.get('mountpoint')
+    if not mountpoint:
+        raise ValueError("no mountpoint given")
+    foreground = fuse_config.get('foreground', True)
+    if config.get('metrics') and not foreground:
+        raise ValueError("metrics need a foreground mount")
+    from SizeFSFuse import SizeFUSE
+    if fuse_config.get('debug'):
+        logging.getLogger().setLevel(logging.DEBUG)
+    operations = build_fuse(config)
+    if config.get('metrics'):
+        start_metrics(config['metrics'],
+                      lambda: dict(readahead=operations.readahead_stats()))
+    # libfuse picks the number of threads of its multithreaded loop
+    SizeFUSE(operations, mountpoint,
+             foreground=foreground,
+             nothreads=not fuse_config.get('threads', True),
+             allow_other=fuse_config.get('allow_other', False))
+
+
+def serve(config):
+    """ serves the SizeFS of a config over HTTP until interrupted """
+    sfs = build_sizefs(config)
+    serve_config = config.get('serve', {})
+    sharded = ShardedServer(sfs, serve_config.get('workers'),
+                            _size(serve_config.get('block_size',
+                                                   BLOCK_SIZE)))
+    if config.get('metrics'):
+        start_metrics(config['metrics'],
+                      lambda: dict(path_cache=sfs.path_cache_stats(),
+                                   workers=len(sharded.workers)))
+    server = SizeFSHTTPServer((serve_config.get('host', '127.0.0.1'),
+                               int(serve_config.get('port', 8000))),
+                              sharded, serve_config.get('verbose', False))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        sharded.close()
+
+
+def bench(config, out=sys.stdout):
+    """ runs the benchmarks of a config """
+    sfs = build_sizefs(config)
+    bench_config = config.get('bench', {})
+    size = _size(bench_config.get('size', 1 << 30))
+    read_size = _size(bench_config.get('read_size', READ_SIZE))
+    block_size = _size(config.get('serve', {}).get('block_size', BLOCK_SIZE))
+    for path in bench_config.get('paths', []):
+        out.write("%s\n%8s %12s\n" % (path, "workers", "MB/s"))
+        for count, rate in bench_workers(
+                sfs, path, bench_config.get('workers', (0, 1, 2, 4)), size,
+                read_size, bench_config.get('readers', 1), block_size):
+            out.write("%8d %12.1f\n" % (count, rate / 1048576))
+    patterns = bench_config.get('patterns', PATTERNS)
+    if patterns:
+        out.write("%-24s %-14s %12s %12s %9s\n" % (
+            "pattern", "kind", "MB/s", "interp MB/s", "speedup"))
+        for pattern, kind, rate, baseline in bench_patterns(
+                patterns, size, read_size, seed=bench_config.get('seed', 0)):
+            out.write("%-24s %-14s %12.1f %12.1f %8.0fx\n" % (
+                pattern, kind, rate / 1048576, baseline / 1048576,
+                rate / baseline))
+
+
+def main(argv=None):
+    """ runs the sizefs command """
+    parser = OptionParser(
+        usage="%prog [--config FILE] mount [mountpoint]\n"
+              "       %prog [--config FILE] serve\n"
+              "       %prog [--config FILE] bench\n"
+              "       %prog [--config FILE] verify path [file|-]")
+    parser.add_option("-c", "--config", help="JSON, YAML or TOML config")
+    parser.add_option("--offset", default="0",
+                      help="offset the data to verify starts at")
+    options, args = parser.parse_args(argv)
+    if not args or args[0] not in COMMANDS:
+        parser.error("choose one of %s" % ", ".join(COMMANDS))
+    try:
+        config = load_config(options.config) if options.config else {}
+    except (IOError, ValueError), error:
+        parser.error(str(error))
+
+    command = args[0]
+    if command == 'mount':
+        mount(config, args[1] if len(args) > 1 else None)
+    elif command == 'serve':
+        serve(config)
+    elif command == 'bench':
+        bench(config)
+    else:
+        if len(args) not in (2, 3):
+            parser.error("verify takes a path and a file")
+        stream = sys.stdin
+        if len(args) == 3 and args[2] != '-':
+            stream = open(args[2], 'rb')
+        workers = config.get('serve', {}).get('workers')
+        mismatch = verify(args[1], stream, sizes.parse_size(options.offset),
+                          build_sizefs(config), workers=workers)
+        if mismatch is not None:
+            print "Mismatch at offset %d" % mismatch
+            return 1
+        print "OK"
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
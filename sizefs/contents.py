@@ -1,14 +1,185 @@
+import binascii
+import bisect
+import os
 import random
+import re
+
+# Runs of NUL bytes shorter than this are reported as data rather than holes
+MIN_HOLE = 4096
+
+# Generated content is produced in blocks drawn from a shared random pool
+BLOCK_SIZE = 65536
+POOL_SIZE = 4 * 1024 * 1024
+POOL_TABLES = 256
+DEDUP_BLOCKS = 64
+
+# Characters with a meaning in patterns, and multipliers of the form {n}
+RESERVED = set("()[]{}*+,-")
+COUNT_REGEX = re.compile(r"\{\d*\}")
+
+# The kinds of pattern, each filled by its own generator
+CONSTANT = 'constant'
+PERIODIC = 'periodic'
+FIXED_RANDOM = 'fixed_random'
+VARIABLE = 'variable'
+
+# Positions of a fixed length random pattern that may differ from the most
+# common character set, beyond which the pattern is treated as variable
+MAX_MIXED = 256
+# Random choices are marked by characters from the Unicode private use area
+MARKER = 0xE000
+MAX_CHOICES = 0x1900
+
 
 class Filler(object):
 
-    def __init__(self, regenerate=False, pattern=None, max_random=128):
+    def __init__(self, regenerate=False, pattern=None, max_random=128,
+                 seed=None):
         self.regenerate = regenerate
         self.pattern = pattern
         self.max_random = max_random
-
-
-    def fill(self, size):
+        self.seed = seed
+        self.block_size = BLOCK_SIZE
+        self._content = None
+        self._holes = None
+        self._kind = None
+        self._tables = None
+        self._source = None
+        self._last = (None, None)
+
+        # A pattern without random choices or random multipliers produces the
+        # same content every time, so it is generated once and tiled
+        pattern = pattern or ""
+        self.fixed = not regenerate or not any(c in pattern for c in "*+[")
+        literals = set(COUNT_REGEX.sub("", pattern)) - RESERVED
+        self.zero = literals == set(["\0"])
+
+
+    @property
+    def content(self):
+        """ the content repeated by a fixed pattern, None if not fixed """
+        if self.zero:
+            return "\0"
+        if not self.fixed:
+            return None
+        if self._content is None:
+            content = ContentGen(pattern=self.pattern, regenerate=False,
+                                 max_random=self.max_random,
+                                 rand=self._random(0))
+            self._content = content.generate_content().next()
+        return self._content
+
+
+    @property
+    def holes(self):
+        """
+        the runs of NUL bytes within one period of the content, as a sorted
+        list of (start, end) pairs
+        """
+        if self._holes is None:
+            content = self.content
+            if content is None:
+                self._holes = []
+            elif content.strip("\0") == "":
+                self._holes = [(0, len(content))]
+            else:
+                self._holes = [m.span() for m in
+                               re.finditer("\0{%d,}" % MIN_HOLE, content)]
+        return self._holes
+
+
+    @property
+    def kind(self):
+        """
+        the kind of pattern: CONSTANT (one repeated character), PERIODIC (a
+        repeated string), FIXED_RANDOM (random choices at fixed positions,
+        such as [a-z]{3}-) or VARIABLE (random multipliers, * and +)
+        """
+        if self._kind is None:
+            content = self.content
+            if content is not None:
+                if content == content[0] * len(content):
+                    self._kind = CONSTANT
+                else:
+                    self._kind = PERIODIC
+            else:
+                self._tables = _position_tables(self.pattern)
+                if self._tables is None:
+                    self._kind = VARIABLE
+                else:
+                    self._kind = FIXED_RANDOM
+        return self._kind
+
+
+    def fill(self, size, offset=0):
+        """
+        returns size bytes of content starting 'offset' bytes into the
+        content, offset applies to all but unseeded variable patterns
+        """
+        if size <= 0:
+            return ""
+        kind = self.kind
+        if kind == CONSTANT:
+            return self.content[0] * size
+        elif kind == PERIODIC:
+            content = self.content
+            period = len(content)
+            phase = offset % period
+            rotated = content[phase:] + content[:phase]
+            whole, part = divmod(size, period)
+            return rotated * whole + rotated[:part]
+        elif kind == FIXED_RANDOM and self.seed is None:
+            return self._fill_random(size, offset % self._tables[1],
+                                     lambda key, length: os.urandom(length))
+
+        # Seeded patterns are generated in blocks so any offset can be read
+        if self.seed is not None:
+            return _fill_blocks(self, size, offset)
+        return self.interpret(size)
+
+
+    def _fill_random(self, size, phase, draw):
+        """
+        fills a fixed length random pattern from 'phase' in its period. Each
+        character set takes its characters in turn from its own stream of
+        random bytes, draw(key, size), translated through the set's table
+        with the bytes that would favour some characters deleted
+        """
+        sets, period = self._tables
+        result = bytearray(size)
+        for number, (options, table, rejected, positions) in enumerate(sets):
+            starts = [(position - phase) % period for position in positions]
+            counts = [len(xrange(start, size, period)) for start in starts]
+            needed = sum(counts)
+            if len(options) == 1:
+                for start, count in zip(starts, counts):
+                    result[start::period] = options * count
+                continue
+            accepted = 256 - len(rejected)
+            chars = []
+            length = 0
+            attempt = 0
+            while length < needed:
+                wanted = (needed - length) * 256 // accepted
+                data = draw(number << 16 | attempt, wanted + wanted // 64 + 64)
+                chars.append(data.translate(table, rejected))
+                length += len(chars[-1])
+                attempt += 1
+            chars = "".join(chars)
+            if len(sets) == 1:
+                return chars[:size]
+            used = 0
+            for start, count in zip(starts, counts):
+                result[start::period] = chars[used:used + count]
+                used += count
+        return str(result)
+
+
+    def interpret(self, size):
+        """
+        returns size bytes of content made by the general pattern
+        interpreter, which is how variable patterns are filled
+        """
         content = ContentGen(pattern=self.pattern, regenerate=self.regenerate, max_random=self.max_random)
         content_string = content.generate_content()
         result = ""
@@ -19,13 +190,281 @@ class Filler(object):
         return result[:size]
 
 
+    def _random(self, index):
+        """ the random generator for block 'index' of a seeded pattern """
+        if self.seed is None:
+            return random
+        return random.Random(_mix(self.seed, index))
+
+
+    def block(self, index):
+        """
+        returns block 'index' of a seeded pattern, the pattern starts afresh
+        at the start of each block unless its random choices are at fixed
+        positions
+        """
+        if self.kind == FIXED_RANDOM:
+            if self._source is None:
+                self._source = RandomFiller(seed=self.seed)
+            source = self._source
+            return self._fill_random(
+                self.block_size, index * self.block_size % self._tables[1],
+                lambda key, length: source._random(index << 32 | key, length))
+        content = ContentGen(pattern=self.pattern, regenerate=True,
+                             max_random=self.max_random,
+                             rand=self._random(index))
+        content_string = content.generate_content()
+        result = []
+        length = 0
+        while length < self.block_size:
+            result.append(content_string.next())
+            length += len(result[-1])
+        return "".join(result)[:self.block_size]
+
+
+    def hole_at(self, offset):
+        """
+        returns (is_hole, end) where 'end' is where the hole or data run
+        containing 'offset' ends, or None if it never ends
+        """
+        holes = self.holes
+        if not holes:
+            return False, None
+        period = len(self.content)
+        if holes == [(0, period)]:
+            return True, None
+        base = offset - offset % period
+        phase = offset - base
+        i = bisect.bisect_right(holes, (phase, period)) - 1
+        if i >= 0 and phase < holes[i][1]:
+            end = holes[i][1]
+            # A hole at the end of the period joins one at the start
+            if end == period and holes[0][0] == 0:
+                end = period + holes[0][1]
+            return True, base + end
+        if i + 1 < len(holes):
+            return False, base + holes[i + 1][0]
+        return False, base + period + holes[0][0]
+
+
+    def allocated(self, size):
+        """ returns how many of the first 'size' bytes are not in holes """
+        holes = self.holes
+        if not holes:
+            return size
+        period = len(self.content)
+        whole, part = divmod(size, period)
+        in_holes = whole * sum(end - start for start, end in holes)
+        in_holes += sum(max(0, min(end, part) - start) for start, end in holes)
+        return size - in_holes
+
+
+
+class RandomFiller(object):
+    """
+    Generates incompressible content in independent blocks, so that any
+    offset can be read without generating what comes before it. Each block
+    is a slice of a pool of random bytes passed through two of a set of
+    random byte permutations, both picked by hashing (seed, block index), so
+    blocks do not repeat within the reach of any compressor
+    """
+
+    fixed = False
+    zero = False
+    content = None
+    holes = []
+
+    def __init__(self, seed=0, block_size=BLOCK_SIZE):
+        if not isinstance(seed, (int, long)):
+            raise ValueError("seed must be an integer, not %r" % (seed,))
+        # Blocks are slices of the pool, so none can be larger than it
+        if (not isinstance(block_size, (int, long))
+                or not 0 < block_size <= POOL_SIZE):
+            raise ValueError("block_size must be between 1 and %d"
+                             % POOL_SIZE)
+        self.seed = seed
+        self.block_size = block_size
+        self.pool, self.tables = _random_pool(seed)
+        self._last = (None, None)
+
+    def _random(self, key, size):
+        """ returns size random bytes for a block key """
+        mixed = _mix(self.seed, key)
+        start = mixed % (len(self.pool) - size + 1)
+        first = self.tables[(mixed >> 32) % POOL_TABLES]
+        second = self.tables[(mixed >> 48) % POOL_TABLES]
+        return self.pool[start:start + size].translate(first).translate(second)
+
+    def block(self, index):
+        """ returns the content of block 'index' """
+        return self._random(index, self.block_size)
+
+    def fill(self, size, offset=0):
+        """ returns size bytes of content starting at 'offset' """
+        return _fill_blocks(self, size, offset)
+
+    def hole_at(self, offset):
+        """ generated content never has holes """
+        return False, None
+
+    def allocated(self, size):
+        """ all of the content is data """
+        return size
+
+
+class CompressibleFiller(RandomFiller):
+    """
+    Generates blocks that compress to roughly (1 - ratio) of their size,
+    each block is random data followed by NUL padding
+    """
+
+    def __init__(self, ratio=0.5, seed=0, block_size=BLOCK_SIZE):
+        super(CompressibleFiller, self).__init__(seed, block_size)
+        if not 0 <= ratio <= 1:
+            raise ValueError("ratio must be between 0 and 1")
+        self.ratio = ratio
+        self.data_size = int(round(block_size * (1 - ratio)))
+        self.padding = "\0" * (block_size - self.data_size)
+
+    def block(self, index):
+        return self._random(index, self.data_size) + self.padding
+
+
+class DedupFiller(CompressibleFiller):
+    """
+    Generates blocks of which roughly 'ratio' are copies of a small set of
+    blocks, the rest are unique. Blocks are also compressible by 'compress'
+    """
+
+    def __init__(self, ratio=0.5, compress=0.0, seed=0,
+                 block_size=BLOCK_SIZE, duplicates=DEDUP_BLOCKS):
+        super(DedupFiller, self).__init__(compress, seed, block_size)
+        if not 0 <= ratio <= 1:
+            raise ValueError("ratio must be between 0 and 1")
+        if not isinstance(duplicates, (int, long)) or duplicates < 1:
+            raise ValueError("duplicates must be at least 1")
+        self.dedup_ratio = ratio
+        self.duplicates = duplicates
+
+    def block(self, index):
+        mixed = _mix(self.seed + 1, index)
+        if (mixed & 0xffffffff) < self.dedup_ratio * 0x100000000:
+            # Duplicate blocks use keys that no unique block has
+            index = -1 - (mixed >> 32) % self.duplicates
+        return super(DedupFiller, self).block(index)
+
+
+class EntropyFiller(RandomFiller):
+    """
+    Generates content with roughly 'bits' of entropy per byte, by drawing
+    every byte uniformly from an alphabet of 2 ** bits symbols
+    """
+
+    def __init__(self, bits=4.0, seed=0, block_size=BLOCK_SIZE):
+        super(EntropyFiller, self).__init__(seed, block_size)
+        if not 0 <= bits <= 8:
+            raise ValueError("bits must be between 0 and 8")
+        self.bits = bits
+        symbols = int(round(2 ** bits))
+        self.table = "".join(chr(b * symbols // 256) for b in xrange(256))
+
+    def block(self, index):
+        return super(EntropyFiller, self).block(index).translate(self.table)
+
+
+# Generator types that can be selected for a directory by name
+GENERATORS = {
+    'incompressible': RandomFiller,
+    'compressible': CompressibleFiller,
+    'dedup': DedupFiller,
+    'entropy': EntropyFiller,
+}
+
+
+def make_filler(spec):
+    """
+    Returns a generator from a spec of the form name[:key=value,...], for
+    example "compressible:ratio=0.5,seed=1"
+    """
+    name, _, params = spec.partition(":")
+    if name not in GENERATORS:
+        raise PatternError("Unknown generator %s" % name)
+    kwargs = {}
+    for param in params.split(","):
+        if not param:
+            continue
+        key, _, value = param.partition("=")
+        try:
+            kwargs[key.strip()] = int(value)
+        except ValueError:
+            try:
+                kwargs[key.strip()] = float(value)
+            except ValueError:
+                raise PatternError("Invalid generator parameter %s" % param)
+    try:
+        return GENERATORS[name](**kwargs)
+    except (TypeError, ValueError), e:
+        raise PatternError("Invalid generator %s: %s" % (spec, e))
+
+
+def _fill_blocks(filler, size, offset):
+    """
+    returns size bytes starting at 'offset' of a filler that makes content
+    in blocks, the last block made is kept for the next sequential read
+    """
+    if size <= 0:
+        return ""
+    block_size = filler.block_size
+    first, skip = divmod(offset, block_size)
+    last = (offset + size - 1) // block_size
+    blocks = []
+    for index in xrange(first, last + 1):
+        cached_index, data = filler._last
+        if cached_index != index:
+            data = filler.block(index)
+            filler._last = (index, data)
+        blocks.append(data)
+    return "".join(blocks)[skip:skip + size]
+
+
+def _mix(seed, key):
+    """ hashes (seed, key) to 64 bits with the splitmix64 finaliser """
+    value = (seed * 0x9e3779b97f4a7c15 + key) & 0xffffffffffffffff
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & 0xffffffffffffffff
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & 0xffffffffffffffff
+    return value ^ (value >> 31)
+
+
+_pools = {}
+
+
+def _random_pool(seed):
+    """
+    Returns the pool of random bytes and the byte permutation tables for a
+    seed, these are generated once per seed and shared
+    """
+    pool = _pools.get(seed)
+    if pool is None:
+        rand = random.Random(seed)
+        data = binascii.unhexlify("%0*x" % (POOL_SIZE * 2,
+                                            rand.getrandbits(POOL_SIZE * 8)))
+        tables = []
+        for _ in xrange(POOL_TABLES):
+            table = [chr(c) for c in xrange(256)]
+            rand.shuffle(table)
+            tables.append("".join(table))
+        pool = _pools.setdefault(seed, (data, tables))
+    return pool
+
 
 class ContentGen(object):
 
-    def __init__(self, pattern=None, regenerate=False, max_random=128):
+    def __init__(self, pattern=None, regenerate=False, max_random=128,
+                 rand=None):
         self.pattern = pattern
         self.regenerate = regenerate
         self.max_random = max_random
+        self.random = rand or random
 
     # BNF for acceptable patterns:
     #   <Pattern> ::= <Expression> | <Expression> <Pattern>
@@ -140,9 +579,9 @@ class ContentGen(object):
 
         top = working.pop(0)
         if top == '*':
-            multiplier = random.randint(0,self.max_random)
+            multiplier = self.random.randint(0,self.max_random)
         elif top == '+':
-            multiplier = random.randint(1,self.max_random)
+            multiplier = self.random.randint(1,self.max_random)
         elif top == '{':
             try:
                 top = working.pop(0)
@@ -182,7 +621,7 @@ class ContentGen(object):
 
     def _return_random_element(self, ls):
         if len(ls) > 1:
-            return ls[random.randint(0,len(ls)-1)]
+            return ls[self.random.randint(0,len(ls)-1)]
         else:
             return ls[0]
 
@@ -209,4 +648,65 @@ class PatternError(Exception):
 
 
     def __str__(self):
-        return repr(self.value)
\ No newline at end of file
+        return repr(self.value)
+
+
+class _ChoiceGen(ContentGen):
+    """
+    Runs a pattern once, marking each random choice with a character from
+    the private use area instead of making it
+    """
+
+    def __init__(self, pattern):
+        ContentGen.__init__(self, pattern=pattern, regenerate=True)
+        self.choices = []
+
+    def _return_random_element(self, ls):
+        if len(ls) > 1:
+            self.choices.append(ls)
+            if len(self.choices) > MAX_CHOICES:
+                raise PatternError("Too many choices")
+            return unichr(MARKER + len(self.choices) - 1)
+        return ls[0]
+
+
+def _position_tables(pattern):
+    """
+    Returns (sets, period) for a pattern whose random choices are all at
+    fixed positions, or None if the pattern is variable. 'sets' holds an
+    (options, table, rejected, positions) tuple for each character set, with
+    the positions in the period it is chosen at. A table maps byte b to
+    options[b % len(options)], and 'rejected' holds the bytes at or above
+    the largest multiple of len(options), which are deleted so that every
+    option is equally likely
+    """
+    if not pattern or "*" in pattern or "+" in pattern:
+        return None
+    gen = _ChoiceGen(pattern)
+    try:
+        result = gen.generate_content().next()
+    except (PatternError, UnicodeError, IndexError):
+        # Patterns the interpreter fails on are left to fail there
+        return None
+    if not result:
+        return None
+    positions = {}
+    for position, char in enumerate(result):
+        choice = ord(char) - MARKER
+        if 0 <= choice < len(gen.choices):
+            options = "".join(gen.choices[choice])
+        else:
+            options = str(char)
+        positions.setdefault(options, []).append(position)
+    common = max(positions, key=lambda options: len(positions[options]))
+    if len(result) - len(positions[common]) > MAX_MIXED:
+        return None
+    sets = []
+    for options, where in sorted(positions.items(), key=lambda item: item[1]):
+        if len(options) > 256:
+            return None
+        limit = len(options) * (256 // len(options))
+        table = "".join(options[b % len(options)] for b in xrange(256))
+        rejected = "".join(chr(b) for b in xrange(limit, 256))
+        sets.append((options, table, rejected, where))
+    return sets, len(result)
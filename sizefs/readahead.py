@@ -0,0 +1,196 @@
+"""
+Readahead
+=========
+
+FUSE splits a sequential read into requests of 128KB, so a file that is
+generated as it is read spends the generation time of each request while
+the reader waits. A ReadAhead wraps an open SizeFile, notices when it is read
+sequentially and generates the blocks after the last read in a background
+thread, into a ring buffer of blocks, so that the next requests are copies
+from memory
+
+>>> from sizefs import SizeFile
+>>> from contents import RandomFiller
+>>> size_file = SizeFile('noise/1MB', 1 << 20, filler=RandomFiller())
+>>> reader = ReadAhead(size_file, block_size=65536, max_window=262144)
+>>> data = [reader.pread(131072, offset) for offset in range(0, 1 << 20, 131072)]
+>>> "".join(data) == size_file.pread(1 << 20, 0)
+True
+>>> reader.close()
+
+The window, how far ahead of the reader blocks are generated, is the
+distance the reader covers in 'horizon' seconds at its observed rate,
+between one block and 'max_window' bytes. A read that does not follow the
+last one drops the window to nothing until reads are sequential again, and
+while the window is empty reads go straight to the SizeFile. The thread is
+only started once reads are sequential. Reads are hits when all of their
+blocks were ready and misses otherwise, stats() returns the counts for
+tuning.
+"""
+
+__author__ = 'mm'
+
+import threading
+import time
+
+BLOCK_SIZE = 128 * 1024
+MAX_WINDOW = 8 * 1024 * 1024
+# Seconds of reading at the observed rate to generate ahead
+HORIZON = 0.25
+# Weight of the latest read in the moving average of the read rate
+RATE_WEIGHT = 0.25
+
+
+class ReadAhead(object):
+    """
+    Reads a SizeFile, prefetching the blocks after sequential reads into a
+    ring buffer of max_window // block_size blocks
+    """
+
+    def __init__(self, size_file, block_size=BLOCK_SIZE, max_window=MAX_WINDOW,
+                 horizon=HORIZON, clock=time.time):
+        self.size_file = size_file
+        self.block_size = block_size
+        self.max_window = max(max_window, block_size)
+        self.horizon = horizon
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.window = 0
+        self.rate = 0.0
+        self._slots = [None] * (self.max_window // block_size)
+        self._next = 0
+        self._last_read = None
+        self._first = 0
+        self._stop = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def close(self):
+        """ stops prefetching and drops the buffered blocks """
+        with self._cond:
+            self._closed = True
+            self._slots = [None] * len(self._slots)
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        """ returns the hit and miss counts, window and read rate """
+        with self._cond:
+            return dict(hits=self.hits, misses=self.misses,
+                        prefetched=self.prefetched, window=self.window,
+                        rate=self.rate)
+
+    def _observe(self, size, offset):
+        """ adapts the window to a read, called with the lock held """
+        now = self.clock()
+        if offset != self._next:
+            self.window = 0
+            self.rate = 0.0
+        elif self._last_read is not None:
+            elapsed = max(now - self._last_read, 1e-6)
+            rate = size / elapsed
+            if self.rate:
+                rate = RATE_WEIGHT * rate + (1 - RATE_WEIGHT) * self.rate
+            self.rate = rate
+            self.window = int(min(self.max_window,
+                                  max(self.block_size,
+                                      self.rate * self.horizon)))
+        self._next = offset + size
+        self._last_read = now
+
+    def pread(self, size, offset):
+        """ returns 'size' bytes from 'offset' as SizeFile.pread does """
+        length = self.size_file.length
+        end = min(offset + size, length)
+        if offset >= end:
+            return ""
+        block_size = self.block_size
+        first = offset // block_size
+        last = (end - 1) // block_size
+        with self._cond:
+            self._observe(size, offset)
+            window = self.window
+            if not window:
+                self.misses += 1
+                self._first = self._stop = 0
+            else:
+                if self._thread is None and not self._closed:
+                    self._thread = threading.Thread(target=self._prefetch)
+                    self._thread.daemon = True
+                    self._thread.start()
+                blocks = [self._get(index)
+                          for index in xrange(first, last + 1)]
+                if all(block is not None for block in blocks):
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                # Blocks before this read will not be wanted again
+                self._first = last
+                if end == (last + 1) * block_size:
+                    self._first = last + 1
+                self._stop = min(
+                    (end + window + block_size - 1) // block_size,
+                    (length + block_size - 1) // block_size,
+                    self._first + len(self._slots))
+                self._cond.notify()
+        if not window:
+            return self.size_file.pread(size, offset)
+
+        for i, block in enumerate(blocks):
+            if block is None:
+                blocks[i] = self._block(first + i)
+                self._keep(first + i, blocks[i])
+        skip = offset - first * block_size
+        return "".join(blocks)[skip:skip + end - offset]
+
+    def _get(self, index):
+        """ returns a buffered block or None, called with the lock held """
+        slot = self._slots[index % len(self._slots)]
+        if slot is not None and slot[0] == index:
+            return slot[1]
+        return None
+
+    def _block(self, index):
+        """ generates a block """
+        start = index * self.block_size
+        return self.size_file.pread(self.block_size, start)
+
+    def _wanted(self):
+        """
+        returns the first block in the window that is not buffered, or None,
+        called with the lock held
+        """
+        for index in xrange(self._first, self._stop):
+            if self._get(index) is None:
+                return index
+        return None
+
+    def _prefetch(self):
+        """ generates the blocks of the window as reads move it along """
+        while True:
+            with self._cond:
+                index = self._wanted()
+                while index is None and not self._closed:
+                    self._cond.wait()
+                    index = self._wanted()
+                if self._closed:
+                    return
+            data = self._block(index)
+            if self._keep(index, data):
+                with self._cond:
+                    self.prefetched += 1
+
+    def _keep(self, index, data):
+        """
+        buffers a block unless the reader has moved past it, returns whether
+        it was kept
+        """
+        with self._cond:
+            if self._first <= index < self._stop and not self._closed:
+                self._slots[index % len(self._slots)] = (index, data)
+                return True
+            return False
@@ -0,0 +1,348 @@
+"""
+Sharded serving
+===============
+
+Serves reads of a SizeFS from a pool of worker processes, so that content
+generation is not limited to one core. Files are split into blocks and each
+worker owns a shard of the (path, block) space, a read is split by shard,
+the workers generate their blocks in parallel and the front end joins them
+
+>>> sfs = SizeFS()
+>>> sfs.add_generator_dir("incompressible", "incompressible", seed=1)
+>>> server = ShardedServer(sfs, workers=2)
+>>> data = server.read('incompressible/1MB', 300000, 4096)
+>>> data == sfs.open('incompressible/1MB').pread(300000, 4096)
+True
+>>> server.close()
+
+The workers are forked from the front end once its patterns, hole tables and
+random pools have been compiled, so they share those tables with the front
+end through copy on write memory rather than each building its own. Reads
+are byte identical to single process reads for fixed patterns, generators
+and seeded patterns; unseeded random patterns differ from read to read in
+either mode. With workers=0 the front end reads directly.
+
+Workers keep the SizeFS as it was when they were forked: a directory added
+or replaced afterwards fails to read, or is read as it was, so directories
+are set up before the server is made.
+
+serve_http puts a server behind HTTP, GET and HEAD of a path return the file
+and single byte ranges are supported
+
+    python serve.py --workers 4 --port 8000
+"""
+
+__author__ = 'mm'
+
+import BaseHTTPServer
+import multiprocessing
+import re
+import SocketServer
+import threading
+import urllib
+import zlib
+from optparse import OptionParser
+
+from fs.errors import ResourceNotFoundError, ResourceInvalidError
+from sizefs import SizeFS, SizeFile
+from sizes import parse_size
+
+BLOCK_SIZE = 1024 * 1024
+# Blocks each worker is asked for at once, bounds the memory of a read
+WINDOW = 8
+FILE_CACHE_SIZE = 4096
+RANGE_REGEX = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def shard(path, block, workers):
+    """ returns the worker that owns block 'block' of 'path' """
+    return (zlib.crc32(path) + block) % workers
+
+
+def warm(sfs):
+    """
+    Compiles the content, hole tables and random pools of every filler in
+    the top level directories of a SizeFS, so that processes forked from it
+    share them
+    """
+    for dir_entry in sfs.root.contents.values():
+        entries = [dir_entry]
+        if isinstance(dir_entry.contents, dict):
+            entries.extend(dir_entry.contents.values())
+        for entry in entries:
+            filler = entry.filler
+            if filler is not None:
+                filler.fill(1)
+                filler.holes
+
+
+def _worker(sfs, conn, block_size):
+    """
+    Serves requests for blocks until it is sent an empty request. A request
+    is a path, its length and a list of blocks, the reply is the blocks
+    joined, or an error message
+    """
+    files = {}
+    while True:
+        try:
+            request = conn.recv_bytes()
+        except (EOFError, IOError):
+            break
+        if not request:
+            break
+        path, length, blocks = request.split("\0")
+        try:
+            size_file = files.get(path)
+            if size_file is None:
+                # The front end has already waited as the profile says
+                size_file = sfs._open(path)
+                size_file.profile = None
+                if len(files) >= FILE_CACHE_SIZE:
+                    files.clear()
+                files[path] = size_file
+            reply = []
+            length = int(length)
+            for block in blocks.split(","):
+                start = int(block) * block_size
+                reply.append(size_file.pread(min(block_size, length - start),
+                                             start))
+            conn.send_bytes("D" + "".join(reply))
+        except Exception as error:  # pylint: disable=W0703
+            conn.send_bytes("E%s: %s" % (type(error).__name__, error))
+
+
+class ShardedServer(object):
+    """
+    Reads files of a SizeFS with 'workers' processes, one per core by
+    default, each generating the blocks of its shard from the SizeFS as it
+    was when the server was made
+    """
+
+    def __init__(self, sfs, workers=None, block_size=BLOCK_SIZE):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.sfs = sfs
+        self.block_size = block_size
+        self.workers = []
+        self._files = {}
+        self._lock = threading.Lock()
+        if workers:
+            warm(sfs)
+        for _ in xrange(workers):
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, args=(sfs, child_conn, block_size))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self.workers.append((process, conn, threading.Lock()))
+
+    def close(self):
+        """ stops the workers """
+        # Workers inherit the front end's connections to the workers forked
+        # before them, so they are told to stop rather than waiting for EOF
+        for process, conn, lock in self.workers:
+            with lock:
+                conn.send_bytes("")
+                conn.close()
+            process.join()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self, path):
+        """
+        returns the SizeFile for a path, raises ResourceInvalidError for
+        files that are not generated, such as those in sink directories.
+        Files are opened once by the front end and kept, so a profile's open
+        latency is paid on the first read of a path and its bandwidth on
+        every read
+        """
+        with self._lock:
+            size_file = self._files.get(path)
+        if size_file is None:
+            size_file = self.sfs.open(path)
+            if not isinstance(size_file, SizeFile):
+                raise ResourceInvalidError(path)
+            with self._lock:
+                if len(self._files) >= FILE_CACHE_SIZE:
+                    self._files.clear()
+                self._files[path] = size_file
+        return size_file
+
+    def size(self, path):
+        """ returns the size of a file """
+        return self.open(path).length
+
+    def read(self, path, size, offset=0):
+        """ returns 'size' bytes of a file from 'offset' """
+        size_file = self.open(path)
+        if not self.workers:
+            return size_file.pread(size, offset)
+        length = size_file.length
+        end = min(offset + size, length)
+        if offset >= end:
+            return ""
+        if size_file.profile is not None:
+            size_file.profile.before_read(end - offset)
+        first = offset // self.block_size
+        last = (end - 1) // self.block_size
+        step = WINDOW * len(self.workers)
+        result = []
+        for start in xrange(first, last + 1, step):
+            result.append(self._read_blocks(
+                path, length, start, min(start + step, last + 1)))
+        data = "".join(result)
+        skip = offset - first * self.block_size
+        return data[skip:skip + end - offset]
+
+    def _read_blocks(self, path, length, first, stop):
+        """ returns blocks first to stop - 1 of a file, joined """
+        shards = {}
+        for block in xrange(first, stop):
+            shards.setdefault(shard(path, block, len(self.workers)),
+                              []).append(block)
+        # Locks are taken in order so that concurrent reads cannot deadlock
+        order = sorted(shards)
+        for index in order:
+            self.workers[index][2].acquire()
+        try:
+            for index in order:
+                self.workers[index][1].send_bytes("%s\0%d\0%s" % (
+                    path, length, ",".join(str(b) for b in shards[index])))
+            # Every reply is received, even after an error, so that the
+            # next request to each worker gets its own reply
+            replies = {}
+            for index in order:
+                replies[index] = self.workers[index][1].recv_bytes()
+        finally:
+            for index in order:
+                self.workers[index][2].release()
+        for index in order:
+            if replies[index][0] == "E":
+                raise IOError("worker %d failed: %s" % (index,
+                                                        replies[index][1:]))
+
+        blocks = []
+        positions = dict((index, 1) for index in order)
+        for block in xrange(first, stop):
+            index = shard(path, block, len(self.workers))
+            position = positions[index]
+            block_length = min(self.block_size,
+                               length - block * self.block_size)
+            blocks.append(replies[index][position:position + block_length])
+            positions[index] = position + block_length
+        return "".join(blocks)
+
+
+class SizeFSRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves GET and HEAD of the files of the server's ShardedServer
+    """
+
+    def _range(self, length):
+        """
+        returns (status, start, end) for the request's Range header, or
+        None if the range cannot be satisfied
+        """
+        header = self.headers.getheader('Range')
+        if header is None:
+            return 200, 0, length
+        match = RANGE_REGEX.match(header.strip())
+        if not match or match.groups() == ('', ''):
+            return 200, 0, length
+        first, last = match.groups()
+        if first == '':
+            start, end = max(0, length - int(last)), length
+        else:
+            start = int(first)
+            end = min(int(last) + 1, length) if last else length
+        if start >= end:
+            return None
+        return 206, start, end
+
+    def _send_head(self):
+        """ sends the headers, returns (start, end) of the body or None """
+        path = urllib.unquote(self.path.split('?', 1)[0])
+        try:
+            length = self.server.sharded.size(path)
+        except (ResourceNotFoundError, ResourceInvalidError, ValueError):
+            self.send_error(404)
+            return None
+        found = self._range(length)
+        if found is None:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */%d' % length)
+            self.end_headers()
+            return None
+        status, start, end = found
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range',
+                             'bytes %d-%d/%d' % (start, end - 1, length))
+        self.end_headers()
+        return path, start, end
+
+    def do_HEAD(self):  # pylint: disable=C0103
+        self._send_head()
+
+    def do_GET(self):  # pylint: disable=C0103
+        found = self._send_head()
+        if found is None:
+            return
+        path, start, end = found
+        sharded = self.server.sharded
+        chunk = sharded.block_size * WINDOW * max(1, len(sharded.workers))
+        for offset in xrange(start, end, chunk):
+            self.wfile.write(sharded.read(path, min(chunk, end - offset),
+                                          offset))
+
+    def log_message(self, *args):  # pylint: disable=W0221
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+
+class SizeFSHTTPServer(SocketServer.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+    """ an HTTP server with a thread per request """
+    daemon_threads = True
+
+    def __init__(self, address, sharded, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address,
+                                           SizeFSRequestHandler)
+        self.sharded = sharded
+        self.verbose = verbose
+
+
+def serve_http(sfs, host='127.0.0.1', port=8000, workers=None,
+               block_size=BLOCK_SIZE, verbose=False):
+    """ serves a SizeFS over HTTP until interrupted """
+    with ShardedServer(sfs, workers, block_size) as sharded:
+        server = SizeFSHTTPServer((host, port), sharded, verbose)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == '__main__':
+    PARSER = OptionParser(usage="%prog [options]")
+    PARSER.add_option("--host", default="127.0.0.1")
+    PARSER.add_option("--port", type="int", default=8000)
+    PARSER.add_option("--workers", type="int", default=None,
+                      help="worker processes, one per core by default")
+    PARSER.add_option("--block-size", default="1MB",
+                      help="size of the blocks of a shard")
+    PARSER.add_option("-v", "--verbose", action="store_true", default=False)
+    OPTIONS, _ = PARSER.parse_args()
+    serve_http(SizeFS(), OPTIONS.host, OPTIONS.port, OPTIONS.workers,
+               parse_size(OPTIONS.block_size), OPTIONS.verbose)
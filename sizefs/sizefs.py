@@ -6,8 +6,8 @@ SizeFS
 A mock Filesystem that exists in memory only. Returns files of a size as
 specified by the filename
 
-For example, reading a file named 128Mb+1 will return a file of 128 Megabytes
-plus 1 byte, reading a file named 128Mb-1 will return a file of 128 Megabytes
+For example, reading a file named 128MB+1 will return a file of 128 Megabytes
+plus 1 byte, reading a file named 128MB-1 will return a file of 128 Megabytes
 minus 1 byte
 
 >>> sfs = SizeFS()
@@ -37,6 +37,31 @@ File content can also be random
 >>> print len(sfs.open('random/128KB+1').read())
 131073
 
+Sizes may use IEC prefixes, fractions and shifts with units, see sizes.py
+
+>>> print len(sfs.open('1.5KiB').read())
+1536
+>>> print len(sfs.open('1MiB-4KiB').read())
+1044480
+>>> sfs.add_regex_dir("decimal", "0", units='decimal')
+>>> print len(sfs.open('decimal/1KB').read())
+1000
+
+File content can come from generators with a controlled compression ratio,
+dedup ratio or entropy, or that is incompressible
+
+>>> sfs.add_generator_dir("half", "compressible", ratio=0.5)
+>>> print len(sfs.open('half/1MB').read())
+1048576
+
+Synthetic trees of any size can be listed and read, the directory name under
+tree gives their shape (see tree.py)
+
+>>> print len(sfs.listdir('tree/depth=2,fanout=100000/d00042'))
+100000
+>>> print sfs.getinfo('tree/depth=2,fanout=10,sizes=fixed(1KB)/d3/f7')['size']
+1024
+
 File content for common file size limits
 
 >>> print sfs.listdir('common')
@@ -48,70 +73,45 @@ File content for common file size limits
 __author__ = 'mm'
 
 import datetime
-import re
+import fnmatch
+import errno
+import hashlib
 import os
+import re
 import stat
-from contents import Filler
-from fs.path import iteratepath, pathsplit, normpath
+import threading
+from itertools import islice
+from contents import Filler, GENERATORS
+from sizes import parse_size, UNITS
+from throttle import PerfProfile
+from tree import get_tree
+from fs.path import iteratepath, pathsplit, normpath, pathcombine, abspath
 from fs.base import FS, synchronize
 from fs.errors import ResourceNotFoundError, ResourceInvalidError
-FILE_REGEX = re.compile("(?P<size>[0-9]*)(?P<si>[TGMK])*"
-                        "(?P<unit>[bB]?)(?P<operator>[\+|\-]?)"
-                        "(?P<shift>\d*)")
-ONE_K = 1024
 
+# lseek whence values for sparse files, as defined by Linux
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+BLOCK_SIZE = 512
+LIST_CHUNK = 1024
+PATH_CACHE_SIZE = 65536
+DIR_MODE = 0755 | stat.S_IFDIR
+FILE_MODE = 0666 | stat.S_IFREG
 
-def __get_shift__(match):
+
+def __get_size__(filename, units='binary'):
     """
-    Parses the shift part of a filename e.g. +128, -110
+    Parses the filename to get the size of a file
+    e.g. 128MB+12, 1.5GiB, 1PiB-4KiB
     """
-    shift = 0
-    keys = match.groupdict().keys()
-    if "operator" in keys and "shift" in keys:
-        operator = match.group('operator')
-        shift_str = match.group('shift')
-        if operator != '' and shift_str != '':
-            shift = int(shift_str)
-            if operator == "-":
-                shift = -shift
-    return shift
-
-
-def __get_size__(filename):
+    return parse_size(filename, units)
+
+
+def _blocks(allocated):
     """
-    Parses the filename to get the size of a file
-    e.g. 128Mb+12, 110Mb-10b
+    Returns the st_blocks of a file with 'allocated' bytes of data
     """
-    match = FILE_REGEX.search(filename)
-    if match:
-        size_str = match.group('size')
-        si_unit = match.group('si')
-        unit = match.group('unit')
-        shift = __get_shift__(match)
-        div = 1
-        if unit == 'b':
-            div = 8
-        elif unit == 'B' or not unit:
-            div = 1
-        else:
-            raise ValueError
-        if not si_unit:
-            mul = 1
-        elif si_unit == 'K':
-            mul = ONE_K
-        elif si_unit == 'M':
-            mul = pow(ONE_K, 2)
-        elif si_unit == 'G':
-            mul = pow(ONE_K, 3)
-        elif si_unit == 'T':
-            mul = pow(ONE_K, 4)
-        else:
-            raise ValueError
-        size = int(size_str)
-        size_in_bytes = (size * mul / div) + shift
-        return size_in_bytes
-    else:
-        return 0
+    return (allocated + BLOCK_SIZE - 1) // BLOCK_SIZE
 
 
 class SizeFile(object):
@@ -119,11 +119,12 @@ class SizeFile(object):
     A mock file object that returns a specified number of bytes
     """
 
-    def __init__(self, path, size, filler=Filler(pattern="0")):
+    def __init__(self, path, size, filler=Filler(pattern="0"), profile=None):
         self.closed = False
         self.length = size
         self.pos = 0
         self.filler = filler
+        self.profile = profile
         self.path = path
 
     def close(self):
@@ -132,43 +133,334 @@ class SizeFile(object):
 
     def read(self, size=None):
         """ read size from the file, or if size is None read to end """
-        if self.pos >= self.length or self.closed:
+        if self.closed:
             return ''
-        if size is None:
-            toread = self.length - self.pos
-            if toread > 0:
-                return self.filler.fill(toread)
-            else:
-                return ''
+        if size is None or size < 0:
+            size = self.length - self.pos
+        result = self.pread(size, self.pos)
+        self.pos = self.pos + len(result)
+        return result
+
+    def pread(self, size, offset):
+        """ read size bytes from 'offset' without moving the position """
+        if offset >= self.length or size <= 0:
+            return ''
+        toread = min(size, self.length - offset)
+        if self.profile is not None:
+            self.profile.before_read(toread)
+        return self.filler.fill(toread, offset)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """ seek to a position, SEEK_DATA and SEEK_HOLE move to the next
+        data or hole at or after 'offset' as lseek does
+        """
+        if whence == os.SEEK_SET:
+            self.pos = offset
+        elif whence == os.SEEK_CUR:
+            self.pos = self.pos + offset
+        elif whence == os.SEEK_END:
+            self.pos = self.length + offset
+        elif whence == SEEK_DATA:
+            self.pos = self.seek_data(offset)
+        elif whence == SEEK_HOLE:
+            self.pos = self.seek_hole(offset)
         else:
-            if size + self.pos >= self.length:
-                toread = self.length - self.pos
-                self.pos = self.length
-                return self.filler.fill(toread)
-            else:
-                toread = size
-                self.pos = self.pos + size
-                return self.filler.fill(toread)
+            raise IOError(errno.EINVAL, "invalid whence", self.path)
+        return self.pos
 
-    def seek(self, offset):
-        """ seek the position by a distance of 'offset' bytes
+    def seek_data(self, offset):
+        """ return the first offset at or after 'offset' that holds data """
+        if offset < 0 or offset >= self.length:
+            raise IOError(errno.ENXIO, "no data after offset", self.path)
+        is_hole, end = self.filler.hole_at(offset)
+        if not is_hole:
+            return offset
+        if end is None or end >= self.length:
+            raise IOError(errno.ENXIO, "no data after offset", self.path)
+        return end
+
+    def seek_hole(self, offset):
+        """ return the first offset at or after 'offset' in a hole, the end
+        of the file counts as a hole
+        """
+        if offset < 0 or offset >= self.length:
+            raise IOError(errno.ENXIO, "offset beyond end of file", self.path)
+        is_hole, end = self.filler.hole_at(offset)
+        if is_hole:
+            return offset
+        if end is None:
+            return self.length
+        return min(end, self.length)
+
+    def data_extents(self, offset=0, length=None):
+        """ yield (offset, length) for each run of data in the file, the
+        rest of the file reads as NUL bytes
         """
-        self.pos = self.pos + offset
+        if length is None:
+            stop = self.length
+        else:
+            stop = min(self.length, offset + length)
+        pos = offset
+        while pos < stop:
+            try:
+                pos = self.seek_data(pos)
+            except IOError:
+                return
+            if pos >= stop:
+                return
+            end = min(self.seek_hole(pos), stop)
+            yield pos, end - pos
+            pos = end
+
+    def allocated(self):
+        """ return how many bytes of the file are data rather than holes """
+        return self.filler.allocated(self.length)
+
+    def blocks(self):
+        """ return the number of 512 byte blocks allocated to the file """
+        return _blocks(self.allocated())
 
     def tell(self):
-        """ return how much of the file is left to read """
+        """ return the current position in the file """
         return self.pos
 
     def flush(self):
         pass
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SinkFile(object):
+    """
+    A mock file object that discards what is written to it, only counting the
+    bytes and optionally feeding them to a running checksum
+    """
+
+    def __init__(self, path, checksum='md5'):
+        self.closed = False
+        self.length = 0
+        self.pos = 0
+        self.bytes_written = 0
+        self.path = path
+        self.checksum_name = checksum
+        self.sequential = True
+        self.profile = None
+        self._hash = hashlib.new(checksum) if checksum else None
+        self._lock = threading.Lock()
+
+    def close(self):
+        """ close the file to prevent further writing """
+        self.closed = True
+
+    def write(self, data):
+        """ write data at the current position """
+        self.pwrite(data, self.pos)
+        self.pos = self.pos + len(data)
+
+    def pwrite(self, data, offset):
+        """ write data at 'offset' without moving the position, the
+        checksum only covers files that are written from start to end
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        with self._lock:
+            if offset != self.length:
+                self.sequential = False
+            elif self._hash is not None:
+                self._hash.update(data)
+            self.bytes_written = self.bytes_written + len(data)
+            self.length = max(self.length, offset + len(data))
+        return len(data)
+
+    def truncate(self, size=None):
+        """ truncating to zero starts counting again """
+        if size is None:
+            size = self.pos
+        with self._lock:
+            if size == 0:
+                self.sequential = True
+                self.bytes_written = 0
+                if self.checksum_name:
+                    self._hash = hashlib.new(self.checksum_name)
+            elif size != self.length:
+                self.sequential = False
+            self.length = size
+
+    def checksum(self):
+        """ return the hex digest of the data written, or None if there is
+        no checksum or the file was not written sequentially
+        """
+        if self._hash is None or not self.sequential:
+            return None
+        return self._hash.hexdigest()
+
+    def read(self, size=None):
+        """ nothing is stored, so there is nothing to read """
+        return ''
+
+    def pread(self, size, offset):
+        """ nothing is stored, so there is nothing to read """
+        return ''
+
+    def seek_data(self, offset):
+        """ nothing is stored, so there is no data after any offset """
+        raise IOError(errno.ENXIO, "no data after offset", self.path)
+
+    def seek_hole(self, offset):
+        """ the whole file is a hole """
+        if offset < 0 or offset >= self.length:
+            raise IOError(errno.ENXIO, "offset beyond end of file", self.path)
+        return offset
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """ seek to a position for the next write """
+        if whence == os.SEEK_SET:
+            self.pos = offset
+        elif whence == os.SEEK_CUR:
+            self.pos = self.pos + offset
+        elif whence == os.SEEK_END:
+            self.pos = self.length + offset
+        else:
+            raise IOError(errno.EINVAL, "invalid whence", self.path)
+        return self.pos
+
+    def tell(self):
+        """ return the current position in the file """
+        return self.pos
+
+    def blocks(self):
+        """ nothing written is stored """
+        return 0
+
+    def flush(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TreeContents(object):
+    """
+    The contents of a directory in a synthetic tree, behaves like the
+    contents dict of a DirEntry but computes each entry from the tree spec
+    when it is looked up, so nothing is stored (see tree.py)
+    """
+
+    def __init__(self, root, tree, components):
+        self.root = root
+        self.tree = tree
+        self.components = components
+
+    def _entry(self, name, size):
+        """ returns a DirEntry for a directory or a file of 'size' """
+        if size is None:
+            return DirEntry('dir', name, contents=TreeContents(
+                self.root, self.tree, self.components + (name,)))
+        filler = self.root.filler
+        return DirEntry('file', name, filler=filler,
+                        mem_file=SizeFile(name, size, filler=filler))
+
+    def get(self, name, default=None):
+        found = self.tree.lookup(self.components + (name,))
+        if found is None:
+            return default
+        return self._entry(name, found[1])
+
+    def __getitem__(self, name):
+        entry = self.get(name)
+        if entry is None:
+            raise KeyError(name)
+        return entry
+
+    def __contains__(self, name):
+        return self.tree.lookup(self.components + (name,)) is not None
+
+    def __len__(self):
+        return self.tree.count(self.components)
+
+    def iterkeys(self, offset=0):
+        for name, _ in self.tree.entries(self.components, offset):
+            yield name
+
+    __iter__ = iterkeys
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def iteritems(self, offset=0):
+        for name, size in self.tree.entries(self.components, offset):
+            yield name, self._entry(name, size)
+
+    def iterinfo(self, offset=0):
+        """
+        yields (name, isdir, info) for each entry, with the info of getinfo
+        but without making a DirEntry for each
+        """
+        now = datetime.datetime.now()
+        allocated = self.root.filler.allocated
+        for name, size in self.tree.entries(self.components, offset):
+            info = {'created_time': now, 'modified_time': now,
+                    'accessed_time': now}
+            if size is None:
+                info['size'] = 4096
+                info['st_nlink'] = 0
+                info['st_mode'] = DIR_MODE
+            else:
+                info['size'] = size
+                info['st_blocks'] = _blocks(allocated(size))
+                info['st_mode'] = FILE_MODE
+            yield name, size is None, info
+
+
+class TreeRootContents(TreeContents):
+    """
+    The contents of the directory of synthetic trees, each name that is a
+    valid tree spec is a tree. There are too many to list, so none are
+    """
+
+    def __init__(self, root):
+        super(TreeRootContents, self).__init__(root, None, ())
+
+    def get(self, name, default=None):
+        tree = get_tree(name)
+        if tree is None:
+            return default
+        return DirEntry('dir', name,
+                        contents=TreeContents(self.root, tree, ()))
+
+    def __contains__(self, name):
+        return get_tree(name) is not None
+
+    def __len__(self):
+        return 0
+
+    def iterkeys(self, offset=0):
+        return iter(())
+
+    __iter__ = iterkeys
+
+    def iteritems(self, offset=0):
+        return iter(())
+
+    def iterinfo(self, offset=0):
+        return iter(())
+
+
 class DirEntry(object):  # pylint: disable=R0902
     """
     A directory entry. Can be a file or folder.
     """
 
     def __init__(self, dir_type, name, contents=None,
-                 filler=Filler(pattern="0")):
+                 filler=Filler(pattern="0"), units='binary', mem_file=None,
+                 sink=False, checksum=None):
 
         assert dir_type in ("dir", "file"), "Type must be dir or file!"
 
@@ -179,14 +471,19 @@ class DirEntry(object):  # pylint: disable=R0902
             contents = {}
 
         self.filler = filler
+        self.units = units
+        self.sink = sink
+        self.checksum = checksum
+        self.profile = None
         self.contents = contents
-        self.mem_file = None
+        self.mem_file = mem_file
         self.created_time = datetime.datetime.now()
         self.modified_time = self.created_time
         self.accessed_time = self.created_time
 
-        if self.type == 'file':
-            self.mem_file = SizeFile(name, __get_size__(name), filler=filler)
+        if self.type == 'file' and mem_file is None:
+            self.mem_file = SizeFile(name, __get_size__(name, units),
+                                     filler=filler)
 
     def desc_contents(self):
         """ describes the contents of this DirEntry """
@@ -209,7 +506,6 @@ class DirEntry(object):  # pylint: disable=R0902
         return "%s:" % (self.name)#, self.desc_contents())
 
 
-log = open('log','w')
 indent = 0
 indStr = '  '
 
@@ -218,6 +514,9 @@ def logmethod(methodname):
 
     def _method(self, *argl, **argd):
         global indent
+        # only log the calls of a verbose SizeFS
+        if not getattr(self, 'verbose', False):
+            return getattr(self,'_H_%s' % methodname)(*argl,**argd)
         #parse the arguments and create a string representation
         args = []
         for item in argl:
@@ -251,10 +550,17 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
     """
 
     __metaclass__ = LogTheMethods
-    logMatch = '.*'
+    # Path resolution is too hot to wrap
+    logMatch = '(?!_get_dir_entry$)'
 
     def __init__(self, *args, **kwargs):
         self.verbose = kwargs.pop("verbose", False)
+        self.path_cache_size = kwargs.pop("path_cache_size", PATH_CACHE_SIZE)
+        self.path_cache_hits = 0
+        self.path_cache_misses = 0
+        self._path_cache = {}
+        # Top level directories with a PerfProfile, usually none
+        self._profiles = set()
         super(SizeFS, self).__init__(*args, **kwargs)
         #thread_synchronize=_thread_synchronize_default)
         self.sizes = [1, 10, 100]
@@ -268,6 +574,7 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
 
         self.zeros = DirEntry('dir', 'zeros', filler=Filler(pattern="0"))
         self.ones = DirEntry('dir', 'ones', filler=Filler(pattern="1"))
+        self.sparse = DirEntry('dir', 'sparse', filler=Filler(pattern="\0"))
         self.random = DirEntry('dir', 'random',
                                filler=Filler(regenerate=True,
                                              pattern="[a-z,A-Z,0-9]",
@@ -282,6 +589,8 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
                 'file', filename, filler=Filler(pattern="0"))
             self.ones.contents[filename] = DirEntry(
                 'file', filename, filler=Filler(pattern="1"))
+            self.sparse.contents[filename] = DirEntry(
+                'file', filename, filler=self.sparse.filler)
             self.random.contents[filename] = DirEntry(
                 'file', filename,
                 filler=Filler(regenerate=True, pattern="[a-z,A-Z,0-9]",
@@ -309,12 +618,53 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
 
         self.root.contents['zeros'] = self.zeros
         self.root.contents['ones'] = self.ones
+        self.root.contents['sparse'] = self.sparse
+        self.tree = DirEntry('dir', 'tree')
+        self.tree.contents = TreeRootContents(self.tree)
+        self.root.contents['tree'] = self.tree
+        self.root.contents['sink'] = DirEntry('dir', 'sink', sink=True,
+                                              checksum='md5')
         self.root.contents['random'] = self.random
         self.root.contents['common'] = self.common
 
     def _get_dir_entry(self, dir_path):
         """
-        Returns a DirEntry for a specified path 'dir_path'
+        Returns a DirEntry for a specified path 'dir_path'. Paths are cached
+        as given, along with paths that do not exist, until a directory is
+        added or changed
+        """
+        try:
+            dir_entry = self._path_cache[dir_path]
+        except KeyError:
+            pass
+        else:
+            self.path_cache_hits += 1
+            return dir_entry
+        self.path_cache_misses += 1
+        dir_entry = self._resolve_path(dir_path)
+        if len(self._path_cache) >= self.path_cache_size:
+            self._path_cache.clear()
+        self._path_cache[dir_path] = dir_entry
+        return dir_entry
+
+    def _clear_path_cache(self):
+        """
+        Forgets resolved paths, called whenever directory contents change
+        """
+        self._path_cache.clear()
+
+    def path_cache_stats(self):
+        """
+        Returns the hits and misses of the path cache and how full it is
+        """
+        return dict(hits=self.path_cache_hits,
+                    misses=self.path_cache_misses,
+                    size=len(self._path_cache),
+                    max_size=self.path_cache_size)
+
+    def _resolve_path(self, dir_path):
+        """
+        Walks the directories to the DirEntry for 'dir_path'
         """
         dir_path = normpath(dir_path)
         current_dir = self.root
@@ -328,25 +678,102 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
         return current_dir
 
     def isdir(self, path):
-        path = normpath(path)
-        if path in ('', '/'):
-            return True
         dir_item = self._get_dir_entry(path)
         if dir_item is None:
             return False
         return dir_item.isdir()
 
-    def add_regex_dir(self, name, regex, max_random=128, regenerate=True):
+    def add_regex_dir(self, name, regex, max_random=128, regenerate=True,
+                      units='binary', seed=None):
+        """
+        Adds a directory whose files are filled by the pattern 'regex'. The
+        SI prefixes of file names in the directory are 'binary' (1KB is 1024
+        bytes) or 'decimal' (1KB is 1000 bytes) according to 'units'. With a
+        'seed' the random choices of the pattern are the same on every read
+        """
+        if units not in UNITS:
+            raise ValueError("units must be one of %s" % ", ".join(UNITS))
         _dir = DirEntry('dir', name,
-                       filler=Filler(regenerate=regenerate, pattern=regex,
-                                     max_random=max_random))
+                        filler=Filler(regenerate=regenerate, pattern=regex,
+                                      max_random=max_random, seed=seed),
+                        units=units)
         self.root.contents[name] = _dir
+        self._clear_path_cache()
+
+    def add_generator_dir(self, name, generator, units='binary', **params):
+        """
+        Adds a directory whose files are filled by a content generator, given
+        as an instance or as the name of one of contents.GENERATORS with its
+        parameters, e.g. add_generator_dir("half", "compressible", ratio=0.5)
+        """
+        if units not in UNITS:
+            raise ValueError("units must be one of %s" % ", ".join(UNITS))
+        if isinstance(generator, basestring):
+            if generator not in GENERATORS:
+                raise ValueError("unknown generator %s" % generator)
+            generator = GENERATORS[generator](**params)
+        self.root.contents[name] = DirEntry('dir', name, filler=generator,
+                                            units=units)
+        self._clear_path_cache()
+
+    def add_sink_dir(self, name, checksum='md5'):
+        """
+        Adds a directory that accepts writes and discards them, counting the
+        bytes written to each file and, unless 'checksum' is None, hashing
+        them with that hashlib algorithm. The counts and checksums are in the
+        'bytes_written' and 'checksum' of getinfo
+        """
+        if checksum is not None:
+            hashlib.new(checksum)
+        self.root.contents[name] = DirEntry('dir', name, sink=True,
+                                            checksum=checksum)
+        self._clear_path_cache()
+
+    def set_profile(self, name, **settings):
+        """
+        Makes a top level directory behave like slow storage, the settings
+        are those of throttle.PerfProfile: bandwidth (e.g. '10MB/s') and
+        read_latency, getattr_latency and open_latency (e.g. '5ms' or
+        'exponential(2ms)'). With no settings the directory is not throttled
+        """
+        dir_entry = self.root.contents.get(name)
+        if dir_entry is None or not dir_entry.isdir():
+            raise ResourceNotFoundError(name)
+        dir_entry.profile = PerfProfile(**settings) if settings else None
+        if settings:
+            self._profiles.add(name)
+        else:
+            self._profiles.discard(name)
+
+    def set_listing(self, name, files):
+        """
+        Makes a top level directory list the files named in 'files', such as
+        ['1KB', '1MB', '1GB'], files not listed can still be opened
+        """
+        dir_entry = self.root.contents.get(name)
+        if dir_entry is None or not dir_entry.isdir() or dir_entry.sink:
+            raise ResourceNotFoundError(name)
+        for filename in files:
+            dir_entry.contents[filename] = DirEntry(
+                'file', filename, filler=dir_entry.filler,
+                units=dir_entry.units)
+        self._clear_path_cache()
+
+    def _profile(self, path):
+        """
+        Returns the PerfProfile of the top level directory of a path
+        """
+        if not self._profiles:
+            return None
+        top = iteratepath(normpath(path), 1)
+        if top:
+            dir_entry = self.root.contents.get(top[0])
+            if dir_entry is not None:
+                return dir_entry.profile
+        return None
 
     @synchronize
     def isfile(self, path):
-        path = normpath(path)
-        if path in ('', '/'):
-            return False
         dir_item = self._get_dir_entry(path)
         if dir_item is None:
             return False
@@ -385,24 +812,129 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
                                       absolute, dirs_only, files_only)
         return p_dirs
 
-    @synchronize
+    def ilistdir(self, path="./", wildcard=None,  # pylint: disable=R0913
+                 full=False, absolute=False,
+                 dirs_only=False, files_only=False):
+        """
+        Yields the names in a directory without building a list of them all
+        first, so that huge synthetic directories can be streamed
+        """
+        dir_entry = self._get_dir_entry(path)
+        if dir_entry is None:
+            raise ResourceNotFoundError(path)
+        if dir_entry.isfile():
+            raise ResourceInvalidError(path, msg="not a directory: %(path)s")
+        names = iter(dir_entry.contents)
+        while True:
+            chunk = [unicode(name) for name in islice(names, LIST_CHUNK)]
+            if not chunk:
+                return
+            for name in self._listdir_helper(path, chunk, wildcard, full,
+                                             absolute, dirs_only,
+                                             files_only):
+                yield name
+
     def getinfo(self, path):
+        # Wait outside the lock so that other directories are not held up
+        profile = self._profile(path)
+        if profile is not None:
+            profile.before_getattr()
+        return self._getinfo(path)
+
+    @synchronize
+    def _getinfo(self, path):
         dir_entry = self._get_dir_entry(path)
+        if dir_entry is None:
+            dir_path, fname = pathsplit(normpath(path))
+            return self._size_info(self._get_dir_entry(dir_path), fname)
+        return self._entry_info(dir_entry)
+
+    def getinfo_many(self, paths):
+        """
+        Returns the info of each of 'paths' as getinfo would, resolving each
+        parent directory once. A slow directory waits once per call
+        """
+        profiles = set(self._profile(path) for path in paths)
+        for profile in profiles:
+            if profile is not None:
+                profile.before_getattr()
+        return self._getinfo_many(paths)
 
+    @synchronize
+    def _getinfo_many(self, paths):
+        parents = {}
+        infos = []
+        for path in paths:
+            dir_path, name = pathsplit(normpath(path))
+            if dir_path in parents:
+                parent_dir_entry = parents[dir_path]
+            else:
+                parent_dir_entry = self._get_dir_entry(dir_path)
+                parents[dir_path] = parent_dir_entry
+            if (name and parent_dir_entry is not None and
+                    parent_dir_entry.isdir()):
+                dir_entry = parent_dir_entry.contents.get(name)
+                if dir_entry is None:
+                    dir_entry = self.zeros.contents.get(name)
+            else:
+                dir_entry = self._get_dir_entry(path)
+            if dir_entry is None:
+                infos.append(self._size_info(parent_dir_entry, name))
+            else:
+                infos.append(self._entry_info(dir_entry))
+        return infos
+
+    def ilistdirinfo(self, path="./", wildcard=None,  # pylint: disable=R0913
+                     full=False, absolute=False,
+                     dirs_only=False, files_only=False):
+        """
+        Yields (name, info) for the entries of a directory, resolving the
+        directory once rather than once per entry
+        """
+        if dirs_only and files_only:
+            raise ValueError("dirs_only and files_only can not both be True")
+        profile = self._profile(path)
+        if profile is not None:
+            profile.before_getattr()
+        dir_entry = self._get_dir_entry(path)
         if dir_entry is None:
-            info = {}
-            info['st_mode'] = 0666 | stat.S_IFREG
-            fname = os.path.basename(path)
-            try:
-                info['size'] = __get_size__(fname)
-                now = datetime.datetime.now()
-                info['created_time'] = now
-                info['modified_time'] = now
-                info['accessed_time'] = now
-                return info
-            except ValueError:
-                return None
+            raise ResourceNotFoundError(path)
+        if dir_entry.isfile():
+            raise ResourceInvalidError(path, msg="not a directory: %(path)s")
+
+        if wildcard is not None and not callable(wildcard):
+            wildcard_re = re.compile(fnmatch.translate(wildcard))
+            wildcard = lambda name: bool(wildcard_re.match(name))
+        path = normpath(path)
+        if absolute:
+            path = abspath(path)
 
+        contents = dir_entry.contents
+        if isinstance(contents, TreeContents):
+            items = contents.iterinfo()
+        else:
+            items = ((name, entry.isdir(), self._entry_info(entry))
+                     for name, entry in contents.items())
+        for name, isdir, info in items:
+            if (dirs_only and not isdir) or (files_only and isdir):
+                continue
+            name = unicode(name)
+            if wildcard is not None and not wildcard(name):
+                continue
+            if full or absolute:
+                name = pathcombine(path, name)
+            yield name, info
+
+    def listdirinfo(self, path="./", wildcard=None,  # pylint: disable=R0913
+                    full=False, absolute=False,
+                    dirs_only=False, files_only=False):
+        return list(self.ilistdirinfo(path, wildcard, full, absolute,
+                                      dirs_only, files_only))
+
+    def _entry_info(self, dir_entry):
+        """
+        Returns the info of a DirEntry
+        """
         info = {}
         info['created_time'] = dir_entry.created_time
         info['modified_time'] = dir_entry.modified_time
@@ -411,18 +943,49 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
         if dir_entry.isdir():
             info['size'] = 4096
             info['st_nlink'] = 0
-            info['st_mode'] = 0755 | stat.S_IFDIR
+            info['st_mode'] = DIR_MODE
         else:
             info['size'] = dir_entry.mem_file.length
-            info['st_mode'] = 0666 | stat.S_IFREG
+            info['st_blocks'] = dir_entry.mem_file.blocks()
+            info['st_mode'] = FILE_MODE
+            if isinstance(dir_entry.mem_file, SinkFile):
+                info['bytes_written'] = dir_entry.mem_file.bytes_written
+                info['checksum'] = dir_entry.mem_file.checksum()
 
         return info
 
-    @synchronize
-    def open(self, path, mode="r", **kwargs):
+    def _size_info(self, parent_dir_entry, fname):
         """
-
+        Returns the info of a file that is not listed in its directory, from
+        the size in its name, or None if its name is not a size
         """
+        info = {}
+        info['st_mode'] = FILE_MODE
+        units = 'binary'
+        filler = self.zeros.filler
+        if parent_dir_entry is not None and parent_dir_entry.isdir():
+            units = parent_dir_entry.units
+            filler = parent_dir_entry.filler
+        try:
+            info['size'] = __get_size__(fname, units)
+            info['st_blocks'] = _blocks(filler.allocated(info['size']))
+            now = datetime.datetime.now()
+            info['created_time'] = now
+            info['modified_time'] = now
+            info['accessed_time'] = now
+            return info
+        except ValueError:
+            return None
+
+    def open(self, path, mode="r", **kwargs):
+        # Wait outside the lock so that other directories are not held up
+        profile = self._profile(path)
+        if profile is not None:
+            profile.before_open()
+        return self._open(path, mode, **kwargs)
+
+    @synchronize
+    def _open(self, path, mode="r", **kwargs):
         path = normpath(path)
         file_path, file_name = pathsplit(path)
         parent_dir_entry = self._get_dir_entry(file_path)
@@ -430,6 +993,10 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
         if parent_dir_entry is None or not parent_dir_entry.isdir():
             raise ResourceNotFoundError(path)
 
+        if parent_dir_entry.sink and ('w' in mode or 'a' in mode or
+                                      '+' in mode):
+            return self._open_sink(parent_dir_entry, path, file_name, mode)
+
         if 'r' in mode:
 
             if file_name in parent_dir_entry.contents:
@@ -437,15 +1004,41 @@ class SizeFS(FS):  # pylint: disable=R0902,R0904,R0921
                 if file_dir_entry.isdir():
                     raise ResourceInvalidError(path)
                 file_dir_entry.accessed_time = datetime.datetime.now()
-                return file_dir_entry.mem_file
+                mem_file = file_dir_entry.mem_file
+                if isinstance(mem_file, SinkFile):
+                    return mem_file
+                return SizeFile(path, mem_file.length, filler=mem_file.filler,
+                                profile=self._profile(path))
             else:
-                size = __get_size__(file_name)
-                mem_file = SizeFile(path, size, filler=parent_dir_entry.filler)
+                size = __get_size__(file_name, parent_dir_entry.units)
+                mem_file = SizeFile(path, size, filler=parent_dir_entry.filler,
+                                    profile=self._profile(path))
                 return mem_file
 
         elif 'w' in mode or 'a' in mode:
             raise NotImplementedError
 
+    def _open_sink(self, parent_dir_entry, path, file_name, mode):
+        """
+        Opens a file in a sink directory for writing, 'w' starts counting
+        again and 'a' carries on from what was already written
+        """
+        file_dir_entry = parent_dir_entry.contents.get(file_name)
+        if file_dir_entry is not None and file_dir_entry.isdir():
+            raise ResourceInvalidError(path)
+        if file_dir_entry is None or 'w' in mode:
+            mem_file = SinkFile(path, checksum=parent_dir_entry.checksum)
+            file_dir_entry = DirEntry('file', file_name, mem_file=mem_file)
+            parent_dir_entry.contents[file_name] = file_dir_entry
+            self._clear_path_cache()
+        mem_file = file_dir_entry.mem_file
+        mem_file.closed = False
+        mem_file.pos = mem_file.length
+        if 'a' not in mode:
+            mem_file.pos = 0
+        file_dir_entry.modified_time = datetime.datetime.now()
+        return mem_file
+
 
 if __name__ == "__main__":
     import doctest
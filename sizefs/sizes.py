@@ -0,0 +1,124 @@
+"""
+Size specifications
+===================
+
+Parses the size spec of a filename into an exact number of bytes. A spec is a
+number with an optional SI or IEC prefix and an optional unit, followed by
+any number of signed shifts written the same way
+
+>>> parse_size('128KB')
+131072
+>>> parse_size('128MB+1')
+134217729
+>>> parse_size('1.5GiB')
+1610612736
+>>> parse_size('1PiB-4KiB')
+1125899906838528
+>>> parse_size('1GB', units='decimal')
+1000000000
+>>> parse_size('1Kb')
+128
+
+IEC prefixes (Ki, Mi, Gi, ...) are always powers of 1024. Plain SI prefixes
+(K, M, G, ...) follow the unit convention of the containing directory, which
+is 'binary' by default so that 1KB is 1024 bytes, or 'decimal'. A trailing
+'b' counts bits, a trailing 'B' (or no unit) counts bytes. Fractions are
+evaluated exactly and a spec that does not come to a whole number of bytes
+is rejected
+
+>>> parse_size('4b+4b')
+1
+>>> parse_size('1b')
+Traceback (most recent call last):
+...
+ValueError: 1b is not a whole number of bytes
+
+"""
+
+__author__ = 'mm'
+
+import re
+from fractions import gcd
+
+_TERM = r"(\d+)(?:\.(\d+))?(?:([kKMGTPE])(i?))?([bB]?)"
+
+SIZE_REGEX = re.compile(r"^%s(?:[\+\-]%s)*$" % (_TERM, _TERM))
+TERM_REGEX = re.compile(r"([\+\-]?)%s" % _TERM)
+
+PREFIXES = ('K', 'M', 'G', 'T', 'P', 'E')
+
+# The unit index, maps a unit convention to the multiplier of each prefix
+UNITS = {
+    'binary': dict((p, 1024 ** (i + 1)) for i, p in enumerate(PREFIXES)),
+    'decimal': dict((p, 1000 ** (i + 1)) for i, p in enumerate(PREFIXES)),
+}
+UNITS['binary'][''] = UNITS['decimal'][''] = 1
+
+# Parsed sizes for recently seen names, one table per unit convention
+CACHE_SIZE = 65536
+_cache = dict((units, {}) for units in UNITS)
+
+
+def _parse(spec, multipliers):
+    """
+    Evaluates a spec already known to match SIZE_REGEX, the terms are summed
+    exactly as total / den and only the sum has to be a whole number
+    """
+    total = 0
+    den = 1
+    binary = UNITS['binary']
+    for match in TERM_REGEX.finditer(spec):
+        sign, whole, frac, prefix, iec, unit = match.groups()
+        prefix = (prefix or '').upper()
+        mul = binary[prefix] if iec else multipliers[prefix]
+        div = 8 if unit == 'b' else 1
+        if frac:
+            value = int(whole + frac) * mul
+            div *= 10 ** len(frac)
+        else:
+            value = int(whole) * mul
+        if div != den:
+            common = den // gcd(den, div) * div
+            total *= common // den
+            value *= common // div
+            den = common
+        if sign == '-':
+            total -= value
+        else:
+            total += value
+    if total % den:
+        raise ValueError("%s is not a whole number of bytes" % spec)
+    total //= den
+    if total < 0:
+        raise ValueError("%s is a negative size" % spec)
+    return total
+
+
+def parse_size(spec, units='binary'):
+    """
+    Returns the size in bytes of a size spec such as 128MB+1, raises a
+    ValueError if spec is not a valid size
+    """
+    cache = _cache[units]
+    try:
+        return cache[spec]
+    except KeyError:
+        pass
+    if not SIZE_REGEX.match(spec):
+        raise ValueError("%s is not a valid size" % spec)
+    size = _parse(spec, UNITS[units])
+    if len(cache) >= CACHE_SIZE:
+        cache.clear()
+    cache[spec] = size
+    return size
+
+
+def is_size(spec, units='binary'):
+    """
+    Returns True if spec is a valid size spec
+    """
+    try:
+        parse_size(spec, units)
+    except ValueError:
+        return False
+    return True
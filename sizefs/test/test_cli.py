@@ -0,0 +1,67 @@
+__author__ = 'mm'
+
+import json
+import os
+import tempfile
+
+from sizefs.cli import load_config, build_sizefs, mount
+
+CONFIG = {
+    "directories": {
+        "noise": {"generator": "incompressible:seed=7",
+                  "files": ["1MB", "1GB"]},
+        "words": {"pattern": "[a-z]{3}-", "seed": 1, "units": "decimal",
+                  "profile": {"bandwidth": "1GB/s"}},
+        "uploads": {"sink": "none"},
+    },
+    "cache": {"paths": 100},
+}
+
+
+def _load(config):
+    handle, path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(handle, "w") as config_file:
+            json.dump(config, config_file)
+        return load_config(path)
+    finally:
+        os.remove(path)
+
+
+def test_build_sizefs():
+    config = _load(CONFIG)
+    assert isinstance(config["directories"]["words"]["pattern"], str)
+    sfs = build_sizefs(config)
+    assert sorted(sfs.listdir('noise')) == ['1GB', '1MB']
+    assert sfs.getinfo('noise/1GB')['size'] == 1 << 30
+    words = sfs.open('words/1KB').read()
+    assert len(words) == 1000 and words == build_sizefs(config).open(
+        'words/1KB').read()
+    assert sfs.path_cache_size == 100
+    with sfs.open('uploads/out', 'w') as out:
+        out.write("abc")
+    assert sfs.getinfo('uploads/out')['bytes_written'] == 3
+
+
+def test_invalid_config():
+    for config in ({"colour": {}},
+                   {"directories": {"x": {"pattern": "0", "sink": "md5"}}},
+                   {"directories": {"x": {"speed": 1}}},
+                   {"directories": {"x": {"profile": {"speed": 1}}}}):
+        try:
+            _load(config)
+        except ValueError:
+            pass
+        else:
+            assert False, config
+
+
+def test_background_metrics():
+    config = {"fuse": {"mountpoint": "/mnt/sizefs", "foreground": False},
+              "metrics": "127.0.0.1:0"}
+    try:
+        mount(config)
+    except ValueError as error:
+        assert "foreground" in str(error)
+    else:
+        assert False
@@ -1,7 +1,11 @@
 __author__ = 'jjw'
 
-from sizefs.contents import Filler
+from sizefs.contents import Filler, PatternError, make_filler
+from sizefs.contents import CONSTANT, PERIODIC, FIXED_RANDOM, VARIABLE
+from sizefs.contents import RandomFiller, CompressibleFiller, DedupFiller
+from sizefs.contents import EntropyFiller
 import re
+import zlib
 
 def test_simple():
     filler = Filler(regenerate=False,pattern="0",max_random=128)
@@ -43,3 +47,110 @@ def test_range():
     assert not match is None
 
 
+
+def test_fill_offset():
+    filler = Filler(regenerate=False,pattern="abc",max_random=128)
+    assert filler.fill(5, offset=4) == "bcabc"
+
+def test_zero_holes():
+    filler = Filler(regenerate=False,pattern="\0",max_random=128)
+    assert filler.hole_at(12345) == (True, None)
+    assert filler.allocated(1 << 40) == 0
+
+def test_mixed_holes():
+    filler = Filler(regenerate=False,pattern="\0{8192}x{4096}",max_random=128)
+    assert filler.holes == [(0, 8192)]
+    assert filler.hole_at(100) == (True, 8192)
+    assert filler.hole_at(8192) == (False, 12288)
+    assert filler.hole_at(12288 + 100) == (True, 12288 + 8192)
+    assert filler.allocated(12288 * 2 + 9000) == 4096 * 2 + 808
+
+def test_short_zero_runs_are_data():
+    filler = Filler(regenerate=False,pattern="\0{16}x",max_random=128)
+    assert filler.holes == []
+    assert filler.allocated(1024) == 1024
+
+def test_generator_offsets():
+    filler = RandomFiller(seed=3)
+    contents = filler.fill(200000)
+    assert filler.fill(100, offset=65500) == contents[65500:65600]
+    assert RandomFiller(seed=3).fill(100, offset=70000) == contents[70000:70100]
+    assert RandomFiller(seed=4).fill(100) != contents[:100]
+
+def test_incompressible():
+    contents = RandomFiller().fill(1 << 20)
+    assert len(zlib.compress(contents)) > len(contents)
+
+def test_compressible():
+    contents = CompressibleFiller(ratio=0.75).fill(1 << 20)
+    ratio = len(zlib.compress(contents)) / float(len(contents))
+    assert 0.2 < ratio < 0.3
+
+def test_dedup():
+    filler = DedupFiller(ratio=0.5, duplicates=4)
+    blocks = set(filler.block(i) for i in range(1000))
+    assert 450 < len(blocks) < 550
+
+def test_entropy():
+    contents = EntropyFiller(bits=2).fill(1 << 16)
+    assert len(set(contents)) == 4
+
+def test_make_filler():
+    filler = make_filler("compressible:ratio=0.25,seed=9")
+    assert isinstance(filler, CompressibleFiller)
+    assert filler.ratio == 0.25 and filler.seed == 9
+    for spec in ("unknown", "compressible:ratio=x", "entropy:bits=9",
+                 "incompressible:seed=1.5", "compressible:seed=1.5",
+                 "incompressible:block_size=0",
+                 "incompressible:block_size=8388608", "dedup:duplicates=0"):
+        try:
+            make_filler(spec)
+        except PatternError:
+            pass
+        else:
+            assert False, spec
+
+def test_seeded_pattern():
+    filler = Filler(regenerate=True, pattern="[a-z]{2}x*", seed=3)
+    contents = filler.fill(200000)
+    assert contents == Filler(regenerate=True, pattern="[a-z]{2}x*",
+                              seed=3).fill(200000)
+    assert filler.fill(1000, 70000) == contents[70000:71000]
+    other = Filler(regenerate=True, pattern="[a-z]{2}x*", seed=4)
+    assert other.fill(200000) != contents
+
+def test_kinds():
+    kinds = [("0", CONSTANT), ("ab", PERIODIC), ("a{3}b", PERIODIC),
+             ("[a-z,A-Z,0-9]", FIXED_RANDOM), ("x[0-9]{2}-", FIXED_RANDOM),
+             ("a(bcd)*e", VARIABLE), ("a[b,c]+", VARIABLE)]
+    for pattern, kind in kinds:
+        assert Filler(regenerate=True, pattern=pattern).kind == kind, pattern
+    assert Filler(regenerate=False, pattern="[a-z]{3}").kind == PERIODIC
+
+def test_periodic_offsets():
+    filler = Filler(regenerate=False, pattern="abcde")
+    assert filler.fill(12, 3) == "deabcdeabcde"
+    assert Filler(pattern="7").fill(5, 123) == "77777"
+
+def test_fixed_random():
+    filler = Filler(regenerate=True, pattern="[a-c]{2}-", seed=5)
+    contents = filler.fill(30000)
+    assert re.match("^([a-c]{2}-)+$", contents)
+    assert set(contents[0::3]) == set("abc")
+    assert filler.fill(1000, 5000) == contents[5000:6000]
+    unseeded = Filler(regenerate=True, pattern="[0-9]x").fill(1001, 1)
+    assert re.match("^x([0-9]x)+$", unseeded)
+
+def test_fixed_random_distribution():
+    # 256 is not a multiple of 62, a byte modulo 62 would favour 8 characters
+    for seed in (None, 11):
+        filler = Filler(regenerate=True, pattern="[a-z,A-Z,0-9]", seed=seed)
+        counts = {}
+        for char in filler.fill(62 * 10000, 70000):
+            counts[char] = counts.get(char, 0) + 1
+        assert len(counts) == 62
+        assert 9400 < min(counts.values()) <= max(counts.values()) < 10600
+    filler = Filler(regenerate=True, pattern="[a-z]{3}-[0-9]{2}", seed=2)
+    contents = filler.fill(200000)
+    assert re.match("^([a-z]{3}-[0-9]{2})+[a-z]{0,2}$", contents)
+    assert filler.fill(100, 65500) == contents[65500:65600]
@@ -0,0 +1,67 @@
+__author__ = 'mm'
+
+import errno
+import os
+
+import pytest
+
+try:
+    from fuse import FuseOSError
+except (ImportError, EnvironmentError):
+    pytest.skip("needs fusepy and libfuse", allow_module_level=True)
+
+from sizefs.SizeFSFuse import SizeFSFuse
+from sizefs.cli import build_fuse
+from sizefs.sizefs import SEEK_DATA, SEEK_HOLE
+
+
+def test_sink_read_and_lseek():
+    fs = SizeFSFuse()
+    fh = fs.create('/sink/out', 0644)
+    assert fs.write('/sink/out', "abcdef", 0, fh) == 6
+    assert fs.getattr('/sink/out')['st_size'] == 6
+    assert fs.read('/sink/out', 6, 0, fh) == ''
+    assert fs.lseek('/sink/out', 2, SEEK_HOLE, fh) == 2
+    with pytest.raises(FuseOSError) as error:
+        fs.lseek('/sink/out', 0, SEEK_DATA, fh)
+    assert error.value.errno == errno.ENXIO
+    fs.release('/sink/out', fh)
+
+    fh = fs.open('/sink/out', os.O_RDONLY)
+    assert fs.read('/sink/out', 10, 0, fh) == ''
+    fs.release('/sink/out', fh)
+
+
+def test_build_fuse_existing_folder():
+    nlink = SizeFSFuse().getattr('/')['st_nlink']
+    fs = build_fuse({"directories": {"ones": {"pattern": "1"},
+                                     "noise": {"generator": "incompressible"}}})
+    assert fs.getattr('/')['st_nlink'] == nlink + 1
+    assert fs.getattr('/ones')['st_nlink'] == 2
+    assert fs.getxattr('/noise', 'generator') == "incompressible"
+
+
+def test_missing_folder_profiles():
+    fs = SizeFSFuse()
+    for name in range(100):
+        with pytest.raises(FuseOSError):
+            fs.getattr('/nope%d/x' % name)
+    assert not any(folder.startswith('/nope') for folder in fs.profiles)
+
+
+def test_sparse_lseek():
+    fs = SizeFSFuse()
+    assert fs.getattr('/sparse/1MB')['st_blocks'] == 0
+    fh = fs.open('/sparse/1MB', os.O_RDONLY)
+    assert fs.lseek('/sparse/1MB', 4096, SEEK_HOLE, fh) == 4096
+    with pytest.raises(FuseOSError) as error:
+        fs.lseek('/sparse/1MB', 0, SEEK_DATA, fh)
+    assert error.value.errno == errno.ENXIO
+    with pytest.raises(FuseOSError) as error:
+        fs.lseek('/sparse/1MB', 1 << 20, SEEK_HOLE, fh)
+    assert error.value.errno == errno.ENXIO
+    fs.release('/sparse/1MB', fh)
+    fh = fs.open('/ones/1MB', os.O_RDONLY)
+    assert fs.lseek('/ones/1MB', 10, SEEK_DATA, fh) == 10
+    assert fs.lseek('/ones/1MB', 10, SEEK_HOLE, fh) == 1 << 20
+    fs.release('/ones/1MB', fh)
@@ -0,0 +1,33 @@
+__author__ = 'mm'
+
+import time
+
+from sizefs.contents import RandomFiller
+from sizefs.readahead import ReadAhead
+from sizefs.sizefs import SizeFile
+
+
+def test_sequential():
+    size_file = SizeFile('noise/4MB', 4 << 20, filler=RandomFiller(seed=1))
+    reader = ReadAhead(size_file, block_size=65536, max_window=1 << 20)
+    data = []
+    for offset in range(0, 4 << 20, 100000):
+        data.append(reader.pread(100000, offset))
+        time.sleep(0.005)
+    reader.close()
+    assert "".join(data) == size_file.pread(4 << 20, 0)
+    stats = reader.stats()
+    assert stats['hits'] > stats['misses'] and stats['prefetched'] > 0
+    assert stats['window'] > 0
+
+
+def test_random():
+    size_file = SizeFile('noise/4MB', 4 << 20, filler=RandomFiller(seed=1))
+    reader = ReadAhead(size_file, block_size=65536, max_window=1 << 20)
+    for offset in (3 << 20, 1 << 20, 2 << 20, 5):
+        assert reader.pread(1000, offset) == size_file.pread(1000, offset)
+    # Nothing is prefetched, or started, until reads are sequential
+    assert reader._thread is None
+    reader.close()
+    assert reader.stats()['hits'] == 0 and reader.window == 0
+    assert reader.pread(10, (4 << 20) - 5) == size_file.pread(5, (4 << 20) - 5)
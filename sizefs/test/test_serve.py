@@ -0,0 +1,72 @@
+__author__ = 'mm'
+
+import threading
+
+import pytest
+import urllib
+import urllib2
+
+from sizefs import SizeFS
+from sizefs.serve import ShardedServer, SizeFSHTTPServer, shard
+
+
+def test_shard():
+    owners = [shard('dir/1GB', block, 3) for block in range(6)]
+    assert sorted(owners) == [0, 0, 1, 1, 2, 2]
+
+
+def test_sharded_read():
+    sfs = SizeFS()
+    sfs.add_regex_dir("seeded", "[a-z]{3}x*", seed=7)
+    sfs.add_regex_dir("fixed", "[a-z]{3}", regenerate=False)
+    sfs.add_generator_dir("dedup", "dedup", ratio=0.5)
+    reads = [('seeded/300KB', 250000, 20000), ('fixed/1MB', 5000, 1000),
+             ('dedup/1MB+1', 1 << 20, 1), ('zeros/10B', 100, 5)]
+    with ShardedServer(sfs, workers=2, block_size=65536) as server:
+        for path, size, offset in reads:
+            data = server.read(path, size, offset)
+            assert data == sfs.open(path).pread(size, offset)
+        assert server.read('zeros/10B', 10, 10) == ""
+
+
+def test_worker_error():
+    sfs = SizeFS()
+    sfs.add_regex_dir('a', 'a')
+    sfs.add_regex_dir('b', 'b')
+    with ShardedServer(sfs, workers=2, block_size=4096) as server:
+        # Workers were forked before the directory existed
+        sfs.add_regex_dir('late', 'c')
+        with pytest.raises(IOError):
+            server.read('late/64KB', 65536)
+        assert server.read('a/64KB', 65536) == 'a' * 65536
+        assert server.read('b/64KB', 65536) == 'b' * 65536
+
+
+def test_http():
+    sfs = SizeFS()
+    with sfs.open('sink/written', 'w') as out:
+        out.write("abc")
+    with ShardedServer(sfs, workers=0) as sharded:
+        server = SizeFSHTTPServer(('127.0.0.1', 0), sharded)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        base = 'http://127.0.0.1:%d/' % server.server_address[1]
+        try:
+            tree = urllib.quote('tree/depth=1,fanout=10,sizes=fixed(1KB)/f3')
+            response = urllib2.urlopen(base + tree)
+            assert response.getcode() == 200
+            assert len(response.read()) == 1024
+            request = urllib2.Request(base + 'ones/10B',
+                                      headers={'Range': 'bytes=2-4'})
+            assert urllib2.urlopen(request).read() == "111"
+            for path in ('sink/written', 'ones/x', 'ones'):
+                try:
+                    urllib2.urlopen(base + path)
+                except urllib2.HTTPError as error:
+                    assert error.code == 404, path
+                else:
+                    assert False, path
+        finally:
+            server.shutdown()
+            server.server_close()
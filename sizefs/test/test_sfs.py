@@ -1,6 +1,9 @@
 __author__ = 'jjw'
 
 from sizefs import SizeFS
+from sizefs.sizefs import SEEK_HOLE
+import errno
+import hashlib
 import re
 
 sfs = SizeFS()
@@ -11,3 +14,138 @@ def test_regex_dir():
     regex_file_contents = regex_file.read()
     match = re.match("a(bcd)*e{4}",regex_file_contents)
     assert (len(regex_file_contents) == 131072 and not match is None)
+
+def test_read_position():
+    sfs.add_regex_dir("abc","abc")
+    abc_file = sfs.open('abc/10B')
+    assert abc_file.read(4) == "abca"
+    abc_file.seek(8)
+    assert abc_file.read() == "ca"
+    assert abc_file.read() == ""
+
+def test_sparse_file():
+    sparse_file = sfs.open('sparse/4GB')
+    assert list(sparse_file.data_extents()) == []
+    assert sfs.getinfo('sparse/4GB')['st_blocks'] == 0
+    assert sfs.getinfo('zeros/4GB')['st_blocks'] == 4 * 1024 ** 3 / 512
+    assert sparse_file.seek(0, SEEK_HOLE) == 0
+    assert sparse_file.read(4) == "\0\0\0\0"
+
+def test_sparse_extents():
+    sfs.add_regex_dir("mixed","\0{8192}x{8192}")
+    mixed_file = sfs.open('mixed/40KB')
+    assert list(mixed_file.data_extents()) == [(8192, 8192), (24576, 8192)]
+    assert mixed_file.seek_data(0) == 8192
+    assert mixed_file.seek_hole(8192) == 16384
+    assert mixed_file.pread(2, 16383) == "x\0"
+    assert sfs.getinfo('mixed/40KB')['st_blocks'] == 32
+
+def test_seek_data_past_end():
+    zeros_file = sfs.open('zeros/1KB')
+    assert zeros_file.seek_data(10) == 10
+    assert zeros_file.seek_hole(10) == 1024
+    try:
+        zeros_file.seek_data(1024)
+    except IOError, e:
+        assert e.errno == errno.ENXIO
+    else:
+        assert False
+
+def test_generator_dir():
+    sfs.add_generator_dir("entropy", "entropy", bits=1, seed=2)
+    contents = sfs.open('entropy/128KB').read()
+    assert len(contents) == 131072 and set(contents) == set("\0\x01")
+    assert sfs.getinfo('entropy/128KB')['st_blocks'] == 256
+
+def test_sink_dir():
+    expected = sfs.open('ones/1MB').read()
+    sink_file = sfs.open('sink/copy', 'wb')
+    for i in range(0, len(expected), 65536):
+        sink_file.write(expected[i:i + 65536])
+    sink_file.close()
+    info = sfs.getinfo('sink/copy')
+    assert info['bytes_written'] == 1048576 and info['size'] == 1048576
+    assert info['checksum'] == hashlib.md5(expected).hexdigest()
+    assert info['st_blocks'] == 0
+    assert sfs.open('sink/copy').read() == ''
+
+def test_sink_append_and_rewrite():
+    sfs.add_sink_dir("sha1_sink", checksum="sha1")
+    sfs.setcontents('sha1_sink/f', 'abc')
+    sink_file = sfs.open('sha1_sink/f', 'ab')
+    sink_file.write('def')
+    assert sfs.getinfo('sha1_sink/f')['checksum'] == \
+        hashlib.sha1('abcdef').hexdigest()
+    sink_file = sfs.open('sha1_sink/f', 'wb')
+    sink_file.seek(10)
+    sink_file.write('x')
+    info = sfs.getinfo('sha1_sink/f')
+    assert info['size'] == 11 and info['bytes_written'] == 1
+    assert info['checksum'] is None
+
+def test_tree_dir():
+    tree = 'tree/depth=3,fanout=20,files=2,sizes=uniform(1KB,2KB),seed=5'
+    assert sfs.isdir(tree)
+    assert sfs.isdir(tree + '/d19/d00')
+    assert not sfs.isdir(tree + '/d20')
+    assert sfs.listdir(tree)[-3:] == [u'd19', u'f00', u'f01']
+    assert len(sfs.listdir(tree + '/d03/d07')) == 20
+    size = sfs.getinfo(tree + '/d03/d07/f11')['size']
+    assert 1024 <= size <= 2048
+    assert len(sfs.open(tree + '/d03/d07/f11').read()) == size
+    assert sfs.listdir(tree + '/d03', files_only=True) == [u'f00', u'f01']
+
+def test_tree_streams():
+    names = sfs.ilistdir('tree/depth=1,fanout=1000000000')
+    assert [names.next() for _ in range(3)] == [u'f000000000', u'f000000001',
+                                                u'f000000002']
+
+def test_listdirinfo():
+    for path in ('zeros', 'tree/depth=2,fanout=50,files=3/d07', 'tree'):
+        listed = sorted((name, sfs.getinfo(path + '/' + name))
+                        for name in sfs.listdir(path))
+        batched = sorted(sfs.listdirinfo(path))
+        assert [name for name, _ in batched] == [name for name, _ in listed]
+        for (_, info), (_, expected) in zip(batched, listed):
+            assert info['size'] == expected['size']
+            assert info['st_mode'] == expected['st_mode']
+            assert info.get('st_blocks') == expected.get('st_blocks')
+
+def test_listdirinfo_filters():
+    tree = 'tree/depth=2,fanout=12,files=2'
+    assert [n for n, _ in sfs.listdirinfo(tree, files_only=True)] == \
+        [u'f00', u'f01']
+    assert len(sfs.listdirinfo(tree, dirs_only=True)) == 12
+    assert [n for n, _ in sfs.ilistdirinfo(tree, wildcard='d1*', full=True)] \
+        == [tree + '/d10', tree + '/d11']
+
+def test_getinfo_many():
+    paths = ['zeros/1KB', 'zeros/5B', 'ones', '', 'nowhere/10B', '1KB',
+             'zeros/notasize', 'tree/depth=1,fanout=3/f2']
+    batched = sfs.getinfo_many(paths)
+    for path, info in zip(paths, batched):
+        expected = sfs.getinfo(path)
+        if expected is None:
+            assert info is None
+        else:
+            assert info['size'] == expected['size']
+            assert info['st_mode'] == expected['st_mode']
+
+def test_path_cache():
+    cached = SizeFS(path_cache_size=4)
+    assert cached.isfile('zeros/1KB')
+    assert cached.isfile('zeros/1KB')
+    stats = cached.path_cache_stats()
+    assert stats['hits'] >= 1 and stats['misses'] >= 1
+    for path in ('a', 'b', 'c', 'd', 'e'):
+        cached.isdir(path)
+    assert cached.path_cache_stats()['size'] <= 4
+
+def test_path_cache_invalidation():
+    cached = SizeFS()
+    assert not cached.isdir('added')
+    cached.add_regex_dir('added', 'x')
+    assert cached.isdir('added')
+    assert cached.getinfo('sink/new') is None
+    cached.setcontents('sink/new', 'abc')
+    assert cached.getinfo('sink/new')['bytes_written'] == 3
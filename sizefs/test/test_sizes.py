@@ -0,0 +1,43 @@
+__author__ = 'mm'
+
+from sizefs.sizes import parse_size, is_size
+
+
+def test_legacy_sizes():
+    assert parse_size('1B') == 1
+    assert parse_size('5') == 5
+    assert parse_size('128KB') == 131072
+    assert parse_size('100MB-1') == 100 * 1024 * 1024 - 1
+    assert parse_size('4GB+1') == 4 * 1024 ** 3 + 1
+    assert parse_size('10Kb') == 1280
+
+
+def test_large_units():
+    assert parse_size('1PiB') == 1024 ** 5
+    assert parse_size('1EiB') == 1024 ** 6
+    assert parse_size('1PiB-4KiB') == 1024 ** 5 - 4096
+    assert parse_size('2E+1P-1') == 2 * 1024 ** 6 + 1024 ** 5 - 1
+
+
+def test_decimal_units():
+    assert parse_size('1GB', units='decimal') == 10 ** 9
+    assert parse_size('1GiB', units='decimal') == 1024 ** 3
+    assert parse_size('1.1T-1K', units='decimal') == 11 * 10 ** 11 - 1000
+
+
+def test_exact_fractions():
+    assert parse_size('1.5GiB') == 3 * 1024 ** 3 // 2
+    assert parse_size('0.25KB+0.5KB') == 768
+    assert not is_size('1.1B')
+    assert not is_size('1b')
+    assert not is_size('1KB-2KB')
+    # Only the total has to be a whole number of bytes
+    assert parse_size('4b+4b') == 1
+    assert parse_size('0.1KB+0.9KB') == 1024
+    assert parse_size('1.5T-1') == 3 * 1024 ** 4 // 2 - 1
+    assert not is_size('0.1KB+0.8KB')
+
+
+def test_invalid_sizes():
+    for spec in ('', 'KB', '1XB', '1KB+', '+1KB', '1KB1', 'abc'):
+        assert not is_size(spec)
@@ -0,0 +1,64 @@
+__author__ = 'mm'
+
+import threading
+import time
+
+from sizefs import SizeFS
+from sizefs.throttle import TokenBucket, Latency, parse_duration
+
+
+def test_durations():
+    assert parse_duration('5ms') == 0.005
+    assert parse_duration('200us') == 0.0002
+    assert parse_duration('1.5s') == 1.5
+    assert parse_duration('2') == 2.0
+
+
+def test_token_bucket():
+    now = [0.0]
+    bucket = TokenBucket(1000, burst=100, clock=lambda: now[0])
+    assert bucket.reserve(100) == 0.0
+    assert bucket.reserve(500) == 0.5
+    assert bucket.reserve(500) == 1.0
+    now[0] = 1.0
+    assert bucket.reserve(0) == 0.0
+    now[0] = 10.0
+    assert bucket.reserve(150) == 0.05
+
+
+def test_latency_distributions():
+    assert Latency('3ms').sample() == 0.003
+    for _ in range(100):
+        assert 0.001 <= Latency('uniform(1ms,2ms)').sample() <= 0.002
+        assert Latency('normal(1ms,5ms)').sample() >= 0
+        assert Latency('exponential(1ms)').sample() >= 0
+    for spec in ('fast', 'uniform(1ms)', 'pareto(1ms)'):
+        try:
+            Latency(spec)
+        except ValueError:
+            pass
+        else:
+            assert False, spec
+
+
+def test_bandwidth_profile():
+    sfs = SizeFS()
+    sfs.set_profile('ones', bandwidth='1MB/s')
+    start = time.time()
+    sfs.open('ones/512KB').read()
+    assert time.time() - start > 0.35
+    start = time.time()
+    sfs.open('zeros/512KB').read()
+    assert time.time() - start < 0.2
+
+
+def test_latency_does_not_block_other_dirs():
+    sfs = SizeFS()
+    sfs.set_profile('ones', getattr_latency='500ms')
+    slow = threading.Thread(target=sfs.getinfo, args=('ones/1KB',))
+    slow.start()
+    time.sleep(0.05)
+    start = time.time()
+    sfs.getinfo('zeros/1KB')
+    assert time.time() - start < 0.2
+    slow.join()
@@ -0,0 +1,41 @@
+__author__ = 'mm'
+
+from sizefs.tree import TreeSpec, get_tree, DIR, FILE
+
+
+def test_spec():
+    tree = TreeSpec("depth=4,fanout=1000,files=3,seed=2,"
+                    "sizes=lognormal(64KB,1.5)")
+    assert (tree.depth, tree.fanout, tree.files, tree.seed) == (4, 1000, 3, 2)
+    assert tree.sizes == ('lognormal', (65536, 1.5))
+    for spec in ("depth=0", "fanout=x", "colour=red", "sizes=pareto(1KB)",
+                 "sizes=uniform(1KB)"):
+        assert get_tree(spec) is None
+
+
+def test_lookup():
+    tree = get_tree("depth=3,fanout=100,files=2")
+    assert tree.lookup(()) == (DIR, None)
+    assert tree.lookup(('d99', 'd00')) == (DIR, None)
+    assert tree.lookup(('d99', 'f01')) == (FILE, 4096)
+    assert tree.lookup(('d99', 'd00', 'f99')) == (FILE, 4096)
+    for path in (('d100',), ('d9',), ('d99', 'f02'), ('d99', 'd00', 'd00'),
+                 ('f00', 'd00')):
+        assert tree.lookup(path) is None
+
+
+def test_entries():
+    tree = get_tree("depth=2,fanout=1000000,sizes=uniform(10,20)")
+    entries = tree.entries(('d123456',), offset=999998)
+    names = [name for name, _ in entries]
+    assert names == ['f999998', 'f999999']
+    assert tree.count(()) == 1000000
+
+
+def test_sizes():
+    tree = get_tree("depth=1,fanout=10000,sizes=lognormal(64KB,1)")
+    sizes = sorted(size for _, size in tree.entries(()))
+    assert 50000 < sizes[5000] < 80000
+    assert sizes == sorted(size for _, size in tree.entries(()))
+    other = get_tree("depth=1,fanout=10000,sizes=lognormal(64KB,1),seed=1")
+    assert sizes != sorted(size for _, size in other.entries(()))
@@ -0,0 +1,55 @@
+__author__ = 'mm'
+
+from StringIO import StringIO
+
+from sizefs import SizeFS
+from sizefs.verify import verify, _ahead
+
+sfs = SizeFS()
+sfs.add_generator_dir("noise", "incompressible", seed=2)
+
+
+def test_verify():
+    data = sfs.open('noise/3MB+5').read()
+    for workers in (0, 2):
+        assert verify('noise/3MB+5', StringIO(data), sfs=sfs,
+                      block_size=65536, workers=workers) is None
+    wrong = data[:2000000] + "x" + data[2000001:]
+    assert verify('noise/3MB+5', StringIO(wrong), sfs=sfs, block_size=65536,
+                  workers=2) == 2000000
+
+
+def test_verify_length():
+    data = sfs.open('noise/100KB').read()
+    assert verify('noise/100KB', StringIO(data[:-1]), sfs=sfs,
+                  workers=0) == 102399
+    assert verify('noise/100KB', StringIO(data + "x"), sfs=sfs,
+                  workers=0) == 102400
+    assert verify('noise/100KB', StringIO(data[100:]), offset=100, sfs=sfs,
+                  workers=0) is None
+
+
+class _Pool(object):
+    """ a pool that records how many blocks it has been asked for """
+
+    class _Result(object):
+
+        def __init__(self, blocks):
+            self.blocks = blocks
+
+        def get(self):
+            return [0] * len(self.blocks)
+
+    def __init__(self):
+        self.asked = 0
+
+    def map_async(self, func, blocks, chunk):
+        self.asked += len(blocks)
+        return self._Result(blocks)
+
+
+def test_verify_ahead():
+    pool = _Pool()
+    for read, _ in enumerate(_ahead(pool, 1000, 8), 1):
+        assert pool.asked <= read + 16
+    assert read == 1000 and pool.asked == 1000
@@ -0,0 +1,174 @@
+"""
+Performance profiles
+====================
+
+Makes a directory behave like slow storage. A profile caps the bandwidth of
+reads with a token bucket and adds latency to reads, getattr and open
+
+>>> profile = PerfProfile(bandwidth='10MB/s', read_latency='uniform(1ms,2ms)')
+>>> profile.bucket.rate
+10485760
+
+Latencies are a duration such as 5ms, 200us or 1.5s, or a distribution of
+durations: uniform(low,high), normal(mean,stddev) or exponential(mean)
+
+>>> Latency('normal(10ms,2ms)').args
+(0.01, 0.002)
+
+Waits never hold a lock, so readers of other directories, and other readers
+of the same directory, are not held up by a thread that is sleeping.
+"""
+
+__author__ = 'mm'
+
+import random
+import re
+import threading
+import time
+
+from sizes import parse_size
+
+DURATION_REGEX = re.compile(r"^(\d+(?:\.\d+)?)(us|ms|s)?$")
+DISTRIBUTION_REGEX = re.compile(r"^(?P<name>\w+)\((?P<args>[^)]*)\)$")
+DURATION_UNITS = {'us': 1e6, 'ms': 1e3, 's': 1.0, None: 1.0}
+
+
+def parse_duration(spec):
+    """
+    Returns the number of seconds in a duration such as 5ms
+    """
+    match = DURATION_REGEX.match(spec.strip())
+    if not match:
+        raise ValueError("%s is not a valid duration" % spec)
+    return float(match.group(1)) / DURATION_UNITS[match.group(2)]
+
+
+def parse_bandwidth(spec):
+    """
+    Returns the bytes per second of a bandwidth such as 10MB/s
+    """
+    if spec.endswith("/s"):
+        spec = spec[:-2]
+    return parse_size(spec)
+
+
+class TokenBucket(object):
+    """
+    Limits a flow of bytes to 'rate' bytes per second with bursts of up to
+    'burst' bytes. Callers reserve tokens and are told how long to wait for
+    them, tokens may be overdrawn so that waiters queue up in arrival order
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else rate / 10.0
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """ take 'amount' tokens and return the seconds until they are due """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / float(self.rate)
+
+    def consume(self, amount):
+        """ wait until 'amount' tokens are available """
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Latency(object):
+    """
+    A fixed or random latency
+    """
+
+    DISTRIBUTIONS = {
+        'fixed': 1,
+        'uniform': 2,
+        'normal': 2,
+        'exponential': 1,
+    }
+
+    def __init__(self, spec):
+        self.spec = spec
+        match = DISTRIBUTION_REGEX.match(spec.strip())
+        if match:
+            self.name = match.group('name')
+            if self.name not in self.DISTRIBUTIONS:
+                raise ValueError("unknown distribution %s" % self.name)
+            self.args = tuple(parse_duration(arg)
+                              for arg in match.group('args').split(","))
+            if len(self.args) != self.DISTRIBUTIONS[self.name]:
+                raise ValueError("%s takes %d arguments" %
+                                 (self.name, self.DISTRIBUTIONS[self.name]))
+        else:
+            self.name = 'fixed'
+            self.args = (parse_duration(spec),)
+        self._random = random.Random()
+
+    def sample(self):
+        """ returns a latency in seconds """
+        if self.name == 'fixed':
+            return self.args[0]
+        elif self.name == 'uniform':
+            return self._random.uniform(*self.args)
+        elif self.name == 'normal':
+            return max(0.0, self._random.normalvariate(*self.args))
+        else:
+            return self._random.expovariate(1.0 / self.args[0])
+
+
+class PerfProfile(object):
+    """
+    The bandwidth and latencies of a directory, any of them can be None
+    """
+
+    SETTINGS = ('bandwidth', 'read_latency', 'getattr_latency',
+                'open_latency')
+
+    def __init__(self, bandwidth=None, read_latency=None,
+                 getattr_latency=None, open_latency=None):
+        self.bucket = None
+        if bandwidth is not None:
+            self.bucket = TokenBucket(parse_bandwidth(bandwidth))
+        self.read_latency = _latency(read_latency)
+        self.getattr_latency = _latency(getattr_latency)
+        self.open_latency = _latency(open_latency)
+
+    def before_read(self, size):
+        """ wait as a read of 'size' bytes would on slow storage """
+        delay = 0.0
+        if self.read_latency is not None:
+            delay = self.read_latency.sample()
+        if self.bucket is not None:
+            delay += self.bucket.reserve(size)
+        if delay > 0:
+            time.sleep(delay)
+
+    def before_getattr(self):
+        """ wait as a getattr would on slow storage """
+        if self.getattr_latency is not None:
+            time.sleep(self.getattr_latency.sample())
+
+    def before_open(self):
+        """ wait as an open would on slow storage """
+        if self.open_latency is not None:
+            time.sleep(self.open_latency.sample())
+
+
+def _latency(spec):
+    """ returns a Latency for a spec, or None """
+    if spec is None:
+        return None
+    return Latency(spec)
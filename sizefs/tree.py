@@ -0,0 +1,201 @@
+"""
+Synthetic directory trees
+=========================
+
+A tree spec describes a directory tree that is never stored, every entry is
+computed from the spec and its path when it is looked up
+
+>>> tree = get_tree("depth=3,fanout=1000,sizes=lognormal(64KB,1.5)")
+>>> tree.count(())
+1000
+>>> tree.lookup(('d042', 'd999', 'f123'))[0]
+'file'
+>>> tree.lookup(('d042', 'd999', 'f123')) == tree.lookup(('d042', 'd999', 'f123'))
+True
+>>> print tree.lookup(('d042', 'd1000'))
+None
+
+The parameters are
+
+  depth   levels of directories, the deepest of which hold the files (3)
+  fanout  subdirectories of each directory, or files of the deepest (10)
+  files   files in each directory above the deepest (0)
+  seed    seed for the file sizes (0)
+  sizes   the distribution of file sizes, one of fixed(size),
+          uniform(low,high), lognormal(median,sigma) or exponential(mean),
+          where sizes are size specs such as 64KB (fixed(4KB))
+
+Directories are named d<n> and files f<n>, with n zero padded to the same
+width throughout the tree.
+"""
+
+__author__ = 'mm'
+
+import hashlib
+import math
+import struct
+
+from sizes import parse_size
+
+DIR = 'dir'
+FILE = 'file'
+
+DISTRIBUTIONS = {
+    'fixed': 1,
+    'uniform': 2,
+    'lognormal': 2,
+    'exponential': 1,
+}
+
+# Parsed trees for recently seen specs
+CACHE_SIZE = 1024
+_trees = {}
+
+
+def _split_params(spec):
+    """
+    Splits a spec on the commas that are not inside brackets
+    """
+    params = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(spec):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            params.append(spec[start:i])
+            start = i + 1
+    params.append(spec[start:])
+    return [param for param in params if param]
+
+
+class TreeSpec(object):
+    """
+    The parameters of a synthetic tree, with the lookups and listings of the
+    entries in it. Paths are given as tuples of names below the tree
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.depth = 3
+        self.fanout = 10
+        self.files = 0
+        self.seed = 0
+        self.sizes = ('fixed', (4096,))
+
+        for param in _split_params(spec):
+            key, _, value = param.partition('=')
+            if key in ('depth', 'fanout', 'files', 'seed'):
+                try:
+                    setattr(self, key, int(value))
+                except ValueError:
+                    raise ValueError("%s must be an integer" % key)
+            elif key == 'sizes':
+                self.sizes = self._parse_sizes(value)
+            else:
+                raise ValueError("unknown tree parameter %s" % key)
+
+        if self.depth < 1 or self.fanout < 1 or self.files < 0:
+            raise ValueError("depth and fanout must be positive")
+        self.width = len(str(max(self.fanout, self.files) - 1))
+
+    @staticmethod
+    def _parse_sizes(value):
+        """ parses a size distribution such as lognormal(64KB,1.5) """
+        name, _, args = value.partition('(')
+        if name not in DISTRIBUTIONS or not args.endswith(')'):
+            raise ValueError("invalid sizes %s" % value)
+        args = args[:-1].split(',')
+        if len(args) != DISTRIBUTIONS[name]:
+            raise ValueError("%s takes %d arguments" %
+                             (name, DISTRIBUTIONS[name]))
+        if name == 'lognormal':
+            return name, (parse_size(args[0]), float(args[1]))
+        return name, tuple(parse_size(arg) for arg in args)
+
+    def _index(self, name, prefix, limit):
+        """ returns n for a name prefix<n> with n below limit, or None """
+        if (len(name) != self.width + 1 or name[0] != prefix or
+                not name[1:].isdigit()):
+            return None
+        index = int(name[1:])
+        if index >= limit:
+            return None
+        return index
+
+    def lookup(self, components):
+        """
+        returns (DIR, None) or (FILE, size) for the entry at a path, or None
+        if there is no such entry
+        """
+        last = len(components) - 1
+        for level, name in enumerate(components):
+            leaf = level == self.depth - 1
+            if level >= self.depth:
+                return None
+            if not leaf and self._index(name, 'd', self.fanout) is not None:
+                continue
+            files = self.fanout if leaf else self.files
+            if level == last and self._index(name, 'f', files) is not None:
+                return FILE, self.size(components)
+            return None
+        return DIR, None
+
+    def count(self, components):
+        """ returns the number of entries in the directory at a path """
+        if len(components) == self.depth - 1:
+            return self.fanout
+        return self.fanout + self.files
+
+    def entries(self, components, offset=0):
+        """
+        yields (name, size) for the entries of the directory at a path,
+        starting from the entry at 'offset', size is None for directories
+        """
+        fmt = "%%s%%0%dd" % self.width
+        if len(components) == self.depth - 1:
+            dirs, files = 0, self.fanout
+        else:
+            dirs, files = self.fanout, self.files
+        for index in xrange(offset, dirs):
+            yield fmt % ('d', index), None
+        for index in xrange(max(0, offset - dirs), files):
+            name = fmt % ('f', index)
+            yield name, self.size(components + (name,))
+
+    def size(self, components):
+        """ returns the size of the file at a path """
+        name, args = self.sizes
+        if name == 'fixed':
+            return args[0]
+        digest = hashlib.md5("%d/%s" % (self.seed, "/".join(components)))
+        first, second = struct.unpack("<QQ", digest.digest())
+        # Uniform in (0, 1], so that the log below is defined
+        uniform = (first + 1) / 18446744073709551616.0
+        if name == 'uniform':
+            low, high = args
+            return low + int(uniform * (high - low + 1) - 1e-9)
+        elif name == 'exponential':
+            return int(-math.log(uniform) * args[0])
+        median, sigma = args
+        angle = 2 * math.pi * second / 18446744073709551616.0
+        normal = math.sqrt(-2 * math.log(uniform)) * math.cos(angle)
+        return int(median * math.exp(sigma * normal))
+
+
+def get_tree(spec):
+    """
+    Returns the TreeSpec for a spec, or None if it is not a valid spec
+    """
+    tree = _trees.get(spec)
+    if tree is None:
+        try:
+            tree = TreeSpec(spec)
+        except ValueError:
+            return None
+        if len(_trees) >= CACHE_SIZE:
+            _trees.clear()
+        _trees[spec] = tree
+    return tree
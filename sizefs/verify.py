@@ -0,0 +1,188 @@
+"""
+Verification
+============
+
+Checks that data which has passed through a copy tool, an object store or a
+network is the content SizeFS would give for a file. verify reads a stream
+of the file's content from 'offset', regenerates what it should be block by
+block and returns the offset of the first byte that is wrong, or None
+
+>>> from StringIO import StringIO
+>>> sfs = SizeFS()
+>>> data = sfs.open('ones/1MB').read()
+>>> print verify('ones/1MB', StringIO(data), sfs=sfs, workers=0)
+None
+>>> print verify('ones/1MB', StringIO(data[:1000] + "x" + data[1001:]),
+...              sfs=sfs, workers=0)
+1000
+>>> print verify('ones/1MB', StringIO(data[4096:]), offset=4096, sfs=sfs,
+...              workers=0)
+None
+
+A stream that ends early or runs on is wrong from where it should have
+ended. Memory use is a few blocks whatever the size of the file: blocks of
+the stream are compared by crc32 with blocks generated by a pool of worker
+processes, which work at most two windows of CHUNK blocks per worker ahead
+of the stream, and only a mismatching block is compared byte by byte.
+Unseeded random patterns cannot be verified, as they differ from read to
+read.
+
+    python verify.py zeros/1GB copy_of_1GB
+    some_tool | python verify.py --generator incompressible:seed=7 data/1GB -
+"""
+
+__author__ = 'mm'
+
+import multiprocessing
+import sys
+import zlib
+from optparse import OptionParser
+
+from contents import make_filler
+from serve import warm
+from sizefs import SizeFS
+from sizes import parse_size
+
+BLOCK_SIZE = 1024 * 1024
+# Blocks handed to a worker at a time
+CHUNK = 4
+
+# The file being verified, set before the workers are forked
+_expected = None
+
+
+def _expected_crc(index):
+    """ returns the crc32 of block 'index' of the file being verified """
+    size_file, offset, block_size = _expected
+    return zlib.crc32(size_file.pread(block_size,
+                                      offset + index * block_size))
+
+
+def _ahead(pool, blocks, window):
+    """
+    yields the crc32 of each block of the file being verified, generated by
+    a pool in windows of 'window' blocks, at most the next window ahead of
+    the one being read
+    """
+    pending = None
+    for start in xrange(0, blocks, window):
+        result = pool.map_async(_expected_crc,
+                                xrange(start, min(start + window, blocks)),
+                                CHUNK)
+        if pending is not None:
+            for crc in pending.get():
+                yield crc
+        pending = result
+    if pending is not None:
+        for crc in pending.get():
+            yield crc
+
+
+def _read_block(stream, size):
+    """ reads 'size' bytes from a stream, fewer only at its end """
+    parts = []
+    while size > 0:
+        part = stream.read(size)
+        if not part:
+            break
+        parts.append(part)
+        size -= len(part)
+    return "".join(parts)
+
+
+def _first_difference(data, expected):
+    """ returns the index of the first byte that differs """
+    step = 4096
+    start = 0
+    while data[start:start + step] == expected[start:start + step]:
+        start += step
+    for index in xrange(start, min(len(data), len(expected))):
+        if data[index] != expected[index]:
+            return index
+    return min(len(data), len(expected))
+
+
+def verify(path, stream, offset=0, sfs=None, block_size=BLOCK_SIZE,
+           workers=None):
+    """
+    Returns the offset in the file 'path' of the first byte of 'stream'
+    that is not the file's content, or None if the stream is the content of
+    the file from 'offset' to its end. With workers=0 blocks are generated
+    in this process, otherwise by that many processes, one per core by
+    default
+    """
+    global _expected  # pylint: disable=W0603
+    if sfs is None:
+        sfs = SizeFS()
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    size_file = sfs.open(path)
+    # Verifying a throttled directory should not be slowed down
+    size_file.profile = None
+    length = max(0, size_file.length - offset)
+    blocks = (length + block_size - 1) // block_size
+
+    _expected = (size_file, offset, block_size)
+    pool = None
+    if workers:
+        warm(sfs)
+        pool = multiprocessing.Pool(workers)
+        crcs = _ahead(pool, blocks, workers * CHUNK)
+    else:
+        crcs = (_expected_crc(index) for index in xrange(blocks))
+    try:
+        for index, expected_crc in enumerate(crcs):
+            data = _read_block(stream, block_size)
+            if zlib.crc32(data) != expected_crc:
+                start = offset + index * block_size
+                expected = size_file.pread(block_size, start)
+                return start + _first_difference(data, expected)
+        if stream.read(1):
+            return offset + length
+        return None
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        _expected = None
+
+
+def main():
+    """ verifies a file or stdin against a SizeFS path """
+    parser = OptionParser(usage="%prog [options] sizefs-path [file|-]")
+    parser.add_option("--offset", default="0",
+                      help="offset in the SizeFS file the data starts at")
+    parser.add_option("--block-size", default="1MB",
+                      help="size of the blocks compared")
+    parser.add_option("--workers", type="int", default=None,
+                      help="worker processes, one per core by default")
+    parser.add_option("--generator",
+                      help="generator spec of the path's directory")
+    parser.add_option("--pattern", help="pattern of the path's directory")
+    parser.add_option("--seed", type="int", default=None,
+                      help="seed of the pattern")
+    options, args = parser.parse_args()
+    if len(args) not in (1, 2):
+        parser.error("give a SizeFS path and a file")
+
+    sfs = SizeFS()
+    folder = args[0].strip("/").split("/")[0]
+    if options.generator:
+        sfs.add_generator_dir(folder, make_filler(options.generator))
+    elif options.pattern:
+        sfs.add_regex_dir(folder, options.pattern, seed=options.seed)
+    if len(args) == 1 or args[1] == "-":
+        stream = sys.stdin
+    else:
+        stream = open(args[1], "rb")
+    mismatch = verify(args[0], stream, parse_size(options.offset), sfs,
+                      parse_size(options.block_size), options.workers)
+    if mismatch is None:
+        print "OK"
+        return 0
+    print "Mismatch at offset %d" % mismatch
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())